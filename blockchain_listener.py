@@ -1,20 +1,64 @@
 # Module for listening to blockchain events
 
+import functools
+import logging
+from collections import OrderedDict
 import json
 import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from web3 import Web3
 from web3.middleware import geth_poa_middleware
-from web3.exceptions import BlockNotFound
+from web3.datastructures import AttributeDict
+from hexbytes import HexBytes
+from eth_abi import decode as abi_decode
+from eth_utils import to_checksum_address
+import websockets
 import asyncio
-from datetime import datetime
 
-from config import ETH_NODE_URL, UNISWAP_V2_FACTORY, UNISWAP_V2_ROUTER, UNISWAP_V3_FACTORY, WETH_ADDRESS
+from config import (ETH_NODE_URL, ETH_NODE_WS_URL, HTTP_REQUEST_TIMEOUT, UNISWAP_V2_FACTORY, SWAP_ROUTER_BYTES,
+                    WETH_ADDRESS, WETH_ADDRESS_LOWER, WETH_ADDRESS_BYTES)
+from dex_data import DexData
+
+logger = logging.getLogger(__name__)
 
 # Uniswap V2 ABI
 UNISWAP_V2_PAIR_ABI = json.loads('''[
     {"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"sender","type":"address"},{"indexed":false,"internalType":"uint256","name":"amount0In","type":"uint256"},{"indexed":false,"internalType":"uint256","name":"amount1In","type":"uint256"},{"indexed":false,"internalType":"uint256","name":"amount0Out","type":"uint256"},{"indexed":false,"internalType":"uint256","name":"amount1Out","type":"uint256"},{"indexed":true,"internalType":"address","name":"to","type":"address"}],"name":"Swap","type":"event"}
 ]''')
 
+# Topic of Swap(address,uint256,uint256,uint256,uint256,address)
+SWAP_EVENT_TOPIC = Web3.keccak(text="Swap(address,uint256,uint256,uint256,uint256,address)").hex()
+SWAP_EVENT_TOPIC_BYTES = bytes(HexBytes(SWAP_EVENT_TOPIC))
+# Types of the non-indexed Swap arguments (amount0In, amount1In, amount0Out, amount1Out)
+SWAP_DATA_TYPES = ('uint256', 'uint256', 'uint256', 'uint256')
+
+# WETH has 18 decimals
+WETH_SCALE = 10 ** 18
+
+# Pending eth_getLogs chunks queued ahead of processing during catch-up
+PIPELINE_QUEUE_SIZE = 32
+
+# Maximum number of concurrent eth_getLogs requests
+MAX_INFLIGHT_RPC = 16
+
+# Number of recently processed transaction hashes remembered to skip duplicates
+SEEN_TX_CACHE_SIZE = 8192
+
+# Polling fallback timing (seconds)
+DEFAULT_BLOCK_TIME = 12.0
+BLOCK_TIME_EMA_WEIGHT = 0.2
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 6.0
+MAX_ERROR_BACKOFF = 60
+
+# Swap amount keys (WETH in, token out) for a buy, indexed by whether WETH is token0
+BUY_AMOUNT_KEYS = (('amount1In', 'amount0Out'), ('amount0In', 'amount1Out'))
+
+# Maximum number of blocks per eth_getLogs request
+GET_LOGS_BLOCK_RANGE = 100
+
 # Uniswap V2 Factory ABI
 UNISWAP_V2_FACTORY_ABI = json.loads('''[
     {"inputs":[{"internalType":"address","name":"tokenA","type":"address"},{"internalType":"address","name":"tokenB","type":"address"}],"name":"getPair","outputs":[{"internalType":"address","name":"pair","type":"address"}],"stateMutability":"view","type":"function"}
@@ -27,76 +71,200 @@ ERC20_ABI = json.loads('''[
     {"constant":true,"inputs":[],"name":"decimals","outputs":[{"name":"","type":"uint8"}],"payable":false,"stateMutability":"view","type":"function"}
 ]''')
 
+def _decode_swap(log):
+    """Decode the arguments of a Uniswap V2 Swap log straight from its topics and data"""
+    topics = log['topics']
+    if len(topics) != 3 or bytes(topics[0]) != SWAP_EVENT_TOPIC_BYTES:
+        raise ValueError("Not a Swap event")
+    
+    amount0_in, amount1_in, amount0_out, amount1_out = abi_decode(SWAP_DATA_TYPES, bytes(HexBytes(log['data'])))
+    return {
+        'sender': to_checksum_address(bytes(topics[1])[-20:]),
+        'amount0In': amount0_in,
+        'amount1In': amount1_in,
+        'amount0Out': amount0_out,
+        'amount1Out': amount1_out,
+        'to': to_checksum_address(bytes(topics[2])[-20:])
+    }
+
+def _create_http_session():
+    """Create a requests session with connection pooling and retries for the node"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=Retry(total=3, backoff_factor=0.3))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+@functools.lru_cache(maxsize=4096)
+def _bloom_bits(item):
+    """Bit positions an item sets in a 2048-bit Ethereum logs bloom"""
+    item_hash = Web3.keccak(item)
+    return tuple(((item_hash[i] << 8) | item_hash[i + 1]) & 2047 for i in (0, 2, 4))
+
+def _bloom_contains(logs_bloom, item):
+    """Check whether an item may be present in a logs bloom (false positives are possible)"""
+    logs_bloom = bytes(logs_bloom)
+    return all(logs_bloom[255 - bit // 8] & (1 << (bit % 8)) for bit in _bloom_bits(item))
+
+@functools.lru_cache(maxsize=4096)
+def _erc20_contract(w3, address):
+    """Build (once) the ERC20 contract object for a checksummed address"""
+    return w3.eth.contract(address=address, abi=ERC20_ABI)
+
+@functools.lru_cache(maxsize=4096)
+def _pair_contract(w3, address):
+    """Build (once) the Uniswap V2 pair contract object for a checksummed address"""
+    return w3.eth.contract(address=address, abi=UNISWAP_V2_PAIR_ABI)
+
 class BlockchainListener:
-    def __init__(self, token_addresses, callback, db=None, pattern_detector=None):
-        self.w3 = Web3(Web3.HTTPProvider(ETH_NODE_URL))
+    def __init__(self, token_addresses, callback, db=None, pattern_detector=None, dex_data=None):
+        # Share one pooled keep-alive session between the provider and batch calls
+        self.session = _create_http_session()
+        self.w3 = Web3(Web3.HTTPProvider(ETH_NODE_URL, request_kwargs={'timeout': HTTP_REQUEST_TIMEOUT}, session=self.session))
         self.w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-        self.token_addresses = [addr.lower() for addr in token_addresses if addr]
+        self.token_addresses = [addr.strip().lower() for addr in token_addresses if addr and addr.strip()]
         self.callback = callback
-        self.factory_contract = self.w3.eth.contract(address=self.w3.to_checksum_address(UNISWAP_V2_FACTORY), abi=UNISWAP_V2_FACTORY_ABI)
-        self.weth_address = WETH_ADDRESS.lower()
+        self.factory_contract = self.w3.eth.contract(address=UNISWAP_V2_FACTORY, abi=UNISWAP_V2_FACTORY_ABI)
+        self.weth_address = WETH_ADDRESS_LOWER
         self.pairs = {}
+        self._seen_tx_hashes = OrderedDict()
         self.db = db
         self.pattern_detector = pattern_detector
         
         # Tambahkan DexData jika diperlukan
-        from dex_data import DexData
-        self.dex_data = DexData()
+        # A shared DexData belongs to the caller, who closes its session
+        self._owns_dex_data = dex_data is None
+        self.dex_data = dex_data or DexData()
         
         # Tambahkan inisialisasi untuk heartbeat
-        self.last_heartbeat = datetime.now()
+        self.last_heartbeat = time.monotonic()
         self.heartbeat_interval = 60 * 30  # 30 menit dalam detik
         
         self.initialize_pairs()
     
-    def initialize_pairs(self):
+    def initialize_pairs(self, token_addresses=None):
         """
         Initialize Uniswap pairs for monitored tokens
         """
-        for token_address in self.token_addresses:
+        if token_addresses is None:
+            token_addresses = self.token_addresses
+        
+        # One malformed entry (e.g. from a typo in TOKEN_ADDRESSES) must not abort the whole batch
+        valid_addresses = []
+        for token_address in token_addresses:
+            if Web3.is_address(token_address):
+                valid_addresses.append(token_address)
+            else:
+                logger.error("Skipping invalid token address %r", token_address)
+        token_addresses = valid_addresses
+        if not token_addresses:
+            return
+        
+        # Resolve all pair addresses in one batch
+        pair_calls = [
+            (self.factory_contract.address,
+             self.factory_contract.encodeABI(fn_name='getPair', args=[self.w3.to_checksum_address(token_address), WETH_ADDRESS]))
+            for token_address in token_addresses
+        ]
+        try:
+            pair_results = self._batch_call(pair_calls)
+        except Exception as e:
+            logger.error("Error fetching pair addresses: %s", e)
+            return
+        
+        pairs_found = []
+        for token_address, result in zip(token_addresses, pair_results):
             try:
-                # Get pair address for token/WETH
-                pair_address = self.factory_contract.functions.getPair(
-                    self.w3.to_checksum_address(token_address),
-                    self.w3.to_checksum_address(self.weth_address)
-                ).call()
-                
+                if result is None:
+                    raise ValueError("getPair call failed")
+                pair_address = self.w3.codec.decode(['address'], result)[0]
                 if pair_address and pair_address != '0x0000000000000000000000000000000000000000':
-                    # Create pair contract
-                    pair_contract = self.w3.eth.contract(address=pair_address, abi=UNISWAP_V2_PAIR_ABI)
-                    
-                    # Get token info
-                    token_contract = self.w3.eth.contract(address=self.w3.to_checksum_address(token_address), abi=ERC20_ABI)
-                    token_name = token_contract.functions.name().call()
-                    token_symbol = token_contract.functions.symbol().call()
-                    token_decimals = token_contract.functions.decimals().call()
-                    
-                    # Store pair info
-                    self.pairs[pair_address.lower()] = {
-                        'contract': pair_contract,
-                        'token_address': token_address,
-                        'token_name': token_name,
-                        'token_symbol': token_symbol,
-                        'token_decimals': token_decimals
-                    }
-                    
-                    print(f"Initialized pair for {token_name} ({token_symbol}): {pair_address}")
+                    pairs_found.append((token_address, self.w3.to_checksum_address(pair_address)))
             except Exception as e:
-                print(f"Error initializing pair for token {token_address}: {e}")
+                logger.error("Error initializing pair for token %s: %s", token_address, e)
+        
+        if not pairs_found:
+            return
+        
+        # Fetch name, symbol and decimals for every token in a second batch
+        token_calls = []
+        for token_address, _ in pairs_found:
+            token_contract = _erc20_contract(self.w3, self.w3.to_checksum_address(token_address))
+            for fn_name in ('name', 'symbol', 'decimals'):
+                token_calls.append((token_contract.address, token_contract.encodeABI(fn_name=fn_name)))
+        try:
+            token_results = self._batch_call(token_calls)
+        except Exception as e:
+            logger.error("Error fetching token info: %s", e)
+            return
+        
+        for i, (token_address, pair_address) in enumerate(pairs_found):
+            try:
+                name_result, symbol_result, decimals_result = token_results[i * 3:i * 3 + 3]
+                if None in (name_result, symbol_result, decimals_result):
+                    raise ValueError("token info call failed")
+                token_name = self.w3.codec.decode(['string'], name_result)[0]
+                token_symbol = self.w3.codec.decode(['string'], symbol_result)[0]
+                token_decimals = self.w3.codec.decode(['uint8'], decimals_result)[0]
+                
+                # Create pair contract
+                pair_contract = _pair_contract(self.w3, pair_address)
+                
+                # Store pair info keyed by raw address bytes
+                self.pairs[bytes(HexBytes(pair_address))] = {
+                    'contract': pair_contract,
+                    'token_address': token_address,
+                    'token_name': token_name,
+                    'token_symbol': token_symbol,
+                    'token_decimals': token_decimals,
+                    'token_scale': 10 ** token_decimals,
+                    # Uniswap V2 orders pair tokens by address
+                    'weth_is_token0': WETH_ADDRESS_BYTES < bytes.fromhex(token_address[2:])
+                }
+                
+                logger.info("Initialized pair for %s (%s): %s", token_name, token_symbol, pair_address)
+            except Exception as e:
+                logger.error("Error initializing pair for token %s: %s", token_address, e)
+    
+    def _batch_call(self, calls):
+        """
+        Execute a list of (to, data) eth_call requests as a single JSON-RPC batch.
+        Returns the raw result bytes in call order, or None for calls that failed.
+        """
+        payload = [
+            {'jsonrpc': '2.0', 'id': i, 'method': 'eth_call', 'params': [{'to': to, 'data': data}, 'latest']}
+            for i, (to, data) in enumerate(calls)
+        ]
+        response = self.session.post(ETH_NODE_URL, json=payload, timeout=HTTP_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        results = [None] * len(calls)
+        for item in response.json():
+            if 'result' in item and item['result'] not in (None, '0x'):
+                results[item['id']] = HexBytes(item['result'])
+        return results
     
     def update_monitored_tokens(self, token_addresses):
         """
         Update the list of monitored tokens
         """
-        self.token_addresses = [addr.lower() for addr in token_addresses if addr]
-        self.pairs = {}
-        self.initialize_pairs()
+        token_addresses = [addr.strip().lower() for addr in token_addresses if addr and addr.strip()]
+        monitored = set(token_addresses)
+        previous = set(self.token_addresses)
+        added = [addr for addr in token_addresses if addr not in previous]
+        self.token_addresses = token_addresses
+        
+        # Keep pairs of tokens that are still monitored, only initialize new ones
+        pairs = {addr: info for addr, info in self.pairs.items() if info['token_address'] in monitored}
+        if not added and len(pairs) == len(self.pairs):
+            return
+        
+        self.pairs = pairs
+        self.initialize_pairs(added)
     
     # Tambahkan di metode listen_for_swaps
     async def listen_for_swaps(self):
         """Listen for swap events on Uniswap pairs"""
-        print("Starting to listen for swap events...")
-        last_block = self.w3.eth.block_number
+        logger.info("Starting to listen for swap events...")
         
         # Tambahkan flag untuk kontrol loop
         self.running = True
@@ -104,31 +272,126 @@ class BlockchainListener:
         # Kirim heartbeat awal
         await self._send_heartbeat("Bot started and listening for swap events")
         
+        try:
+            if ETH_NODE_WS_URL:
+                await self._listen_via_websocket()
+            else:
+                await self._listen_via_polling()
+        finally:
+            if self._owns_dex_data:
+                await self.dex_data.close()
+    
+    async def _listen_via_websocket(self):
+        """
+        Subscribe to Swap logs of the monitored pairs and process them as they arrive.
+        After a reconnect, the blocks mined while disconnected are fetched with get_logs.
+        """
+        loop = asyncio.get_running_loop()
+        last_block = None
+        while self.running:
+            try:
+                async with websockets.connect(ETH_NODE_WS_URL) as ws:
+                    pairs = self.pairs
+                    if not pairs:
+                        await self._check_heartbeat("Bot still running. No pairs to monitor")
+                        await asyncio.sleep(5)
+                        continue
+                    
+                    await ws.send(json.dumps({
+                        'jsonrpc': '2.0',
+                        'id': 1,
+                        'method': 'eth_subscribe',
+                        'params': ['logs', {
+                            'address': [pair_info['contract'].address for pair_info in pairs.values()],
+                            'topics': [SWAP_EVENT_TOPIC]
+                        }]
+                    }))
+                    subscription_id = json.loads(await ws.recv()).get('result')
+                    logger.info("Subscribed to swap logs for %d pairs: %s", len(pairs), subscription_id)
+                    
+                    # Catch up on the gap once the subscription is live. The last block seen is
+                    # fetched again since its logs may have been cut off; swaps seen both ways
+                    # are skipped by _handle_swap_log.
+                    head = await loop.run_in_executor(None, self.w3.eth.get_block_number)
+                    if last_block is not None and head >= last_block:
+                        logger.info("Catching up on blocks %d to %d", last_block, head)
+                        if await self.check_blocks_for_swaps(last_block, head) < head:
+                            raise RuntimeError(f"could not catch up on blocks {last_block} to {head}")
+                    last_block = head if last_block is None else max(last_block, head)
+                    
+                    # Resubscribe when the monitored pairs change
+                    while self.running and pairs is self.pairs:
+                        await self._check_heartbeat("Bot still running. Listening for swap events via websocket")
+                        
+                        try:
+                            message = await asyncio.wait_for(ws.recv(), timeout=5)
+                        except asyncio.TimeoutError:
+                            continue
+                        
+                        log = json.loads(message).get('params', {}).get('result')
+                        if log and not log.get('removed'):
+                            log = self._normalize_log(log)
+                            await self._handle_swap_log(log)
+                            last_block = max(last_block, log['blockNumber'])
+            except Exception as e:
+                logger.error("Error in websocket listener: %s", e)
+                await asyncio.sleep(10)
+    
+    async def _listen_via_polling(self):
+        """
+        Poll for new blocks and check them for swap events.
+        The poll interval follows the measured block time and errors back off exponentially.
+        """
+        loop = asyncio.get_running_loop()
+        latest_block = await loop.run_in_executor(None, self.w3.eth.get_block, 'latest')
+        last_block = latest_block['number']
+        head_number = latest_block['number']
+        head_timestamp = latest_block['timestamp']
+        block_time = DEFAULT_BLOCK_TIME
+        error_backoff = 0
+        
         while self.running:
             try:
                 # Cek apakah ada sinyal untuk berhenti setiap iterasi
-                current_block = self.w3.eth.block_number
+                latest_block = await loop.run_in_executor(None, self.w3.eth.get_block, 'latest')
+                current_block = latest_block['number']
+                
+                # Track the average time between blocks
+                if current_block > head_number:
+                    interval = (latest_block['timestamp'] - head_timestamp) / (current_block - head_number)
+                    if interval > 0:
+                        block_time = BLOCK_TIME_EMA_WEIGHT * interval + (1 - BLOCK_TIME_EMA_WEIGHT) * block_time
+                    head_number = current_block
+                    head_timestamp = latest_block['timestamp']
                 
                 # Cek apakah perlu mengirim heartbeat
-                current_time = datetime.now()
-                time_diff = (current_time - self.last_heartbeat).total_seconds()
-                if time_diff >= self.heartbeat_interval:
-                    await self._send_heartbeat(f"Bot still running. Checked blocks up to {current_block}")
-                    self.last_heartbeat = current_time
+                await self._check_heartbeat(f"Bot still running. Checked blocks up to {current_block}")
                 
                 if current_block > last_block:
-                    print(f"Checking blocks {last_block+1} to {current_block}")
-                    
-                    for block_number in range(last_block + 1, current_block + 1):
-                        await self.check_block_for_swaps(block_number)
+                    logger.debug("Checking blocks %d to %d", last_block + 1, current_block)
                     
-                    last_block = current_block
+                    # A single new block whose logs bloom rules out our pairs needs no log query
+                    if current_block == last_block + 1 and not self._bloom_might_match(latest_block['logsBloom']):
+                        last_block = current_block
+                    else:
+                        last_block = await self.check_blocks_for_swaps(last_block + 1, current_block)
                 
-                # Sleep dengan timeout pendek agar bisa merespons sinyal
-                await asyncio.sleep(5)  # Kurangi dari 12 detik menjadi 5 detik
+                error_backoff = 0
+                
+                # Wake up shortly after the next block is expected
+                until_next_block = block_time - (time.time() - head_timestamp) - 0.2
+                await asyncio.sleep(max(MIN_POLL_INTERVAL, min(until_next_block, MAX_POLL_INTERVAL)))
             except Exception as e:
-                print(f"Error in blockchain listener: {e}")
-                await asyncio.sleep(10)  # Kurangi dari 30 detik menjadi 10 detik
+                error_backoff = min(error_backoff * 2, MAX_ERROR_BACKOFF) if error_backoff else 1
+                logger.error("Error in blockchain listener: %s. Retrying in %ss", e, error_backoff)
+                await asyncio.sleep(error_backoff)
+    
+    async def _check_heartbeat(self, message):
+        """Send a heartbeat if the heartbeat interval has elapsed"""
+        current_time = time.monotonic()
+        if current_time - self.last_heartbeat >= self.heartbeat_interval:
+            await self._send_heartbeat(message)
+            self.last_heartbeat = current_time
     
     async def _send_heartbeat(self, message):
         """Send heartbeat message to admin"""
@@ -139,106 +402,219 @@ class BlockchainListener:
             heartbeat_event = {
                 'is_heartbeat': True,
                 'message': message,
-                'timestamp': datetime.now().timestamp()
+                'timestamp': time.time()
             }
             
             # Panggil callback dengan event heartbeat
             await self.callback(heartbeat_event)
         except Exception as e:
-            print(f"Error sending heartbeat: {e}")
+            logger.error("Error sending heartbeat: %s", e)
     
     # Tambahkan metode untuk menghentikan listener
     def stop(self):
         """Stop the blockchain listener"""
         self.running = False
     
-    async def check_block_for_swaps(self, block_number):
+    async def check_blocks_for_swaps(self, from_block, to_block):
         """
-        Check a specific block for swap events
+        Check a range of blocks for swap events on the monitored pairs.
+        Logs are fetched in bounded chunks while earlier chunks are processed.
+        Returns the last block that was fully processed.
         """
+        queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        semaphore = asyncio.Semaphore(MAX_INFLIGHT_RPC)
+        
+        async def produce():
+            # Query logs in bounded ranges so large catch-ups stay within node limits
+            for chunk_start in range(from_block, to_block + 1, GET_LOGS_BLOCK_RANGE):
+                chunk_end = min(chunk_start + GET_LOGS_BLOCK_RANGE - 1, to_block)
+                task = asyncio.create_task(self._fetch_swap_logs(chunk_start, chunk_end, semaphore))
+                await queue.put((chunk_end, task))
+            await queue.put(None)
+        
+        producer = asyncio.create_task(produce())
+        last_processed = from_block - 1
         try:
-            block = self.w3.eth.get_block(block_number, full_transactions=True)
-            
-            for tx in block['transactions']:
-                # Check if transaction is to Uniswap Router
-                if tx['to'] and tx['to'].lower() == UNISWAP_V2_ROUTER.lower():
-                    # Get transaction receipt
-                    receipt = self.w3.eth.get_transaction_receipt(tx['hash'])
-                    
-                    # Process logs for swap events
-                    for log in receipt['logs']:
-                        # Check if log is from a monitored pair
-                        if 'address' in log and log['address'].lower() in self.pairs:
-                            pair_info = self.pairs[log['address'].lower()]
-                            pair_contract = pair_info['contract']
-                            
-                            # Try to parse the log as a Swap event
-                            try:
-                                parsed_log = pair_contract.events.Swap().process_log(log)
-                                event_args = parsed_log['args']
-                                
-                                # Check if this is a buy (ETH/WETH to token)
-                                is_buy = self._is_token_buy(event_args, pair_info['token_address'])
-                                
-                                if is_buy:
-                                    # Process the buy event
-                                    await self._process_buy_event(
-                                        tx['hash'].hex(),
-                                        event_args,
-                                        pair_info,
-                                        tx['from']
-                                    )
-                            except Exception as e:
-                                # Not a Swap event or error parsing
-                                pass
-        except BlockNotFound:
-            print(f"Block {block_number} not found")
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                
+                chunk_end, task = item
+                try:
+                    logs = await task
+                except Exception as e:
+                    logger.error("Error checking blocks %d to %d: %s", last_processed + 1, chunk_end, e)
+                    break
+                
+                # Group swaps by transaction so each transaction yields at most one buy event
+                tx_swaps = {}
+                for log, pair_info in self._filter_monitored_logs(logs):
+                    tx_swaps.setdefault(bytes(log['transactionHash']), []).append((log, pair_info))
+                
+                for swaps in tx_swaps.values():
+                    for log, pair_info in swaps:
+                        if await self._handle_swap_log(log, pair_info):
+                            break
+                last_processed = chunk_end
+        finally:
+            producer.cancel()
+            while not queue.empty():
+                item = queue.get_nowait()
+                if item is not None:
+                    item[1].cancel()
+        
+        return last_processed
+    
+    def _filter_monitored_logs(self, logs):
+        """
+        Pair each live log emitted by a monitored pair with its pair info in a
+        single pass. Logs of pairs removed while the fetch was in flight are dropped.
+        """
+        pairs = self.pairs
+        if not logs or not pairs:
+            return []
+        
+        matched = []
+        for log in logs:
+            pair_info = pairs.get(bytes.fromhex(log['address'][2:]))
+            if pair_info is not None and not log.get('removed'):
+                matched.append((log, pair_info))
+        return matched
+    
+    def _bloom_might_match(self, logs_bloom):
+        """
+        Check whether a block's logs bloom may contain a Swap log from a monitored pair
+        """
+        if not _bloom_contains(logs_bloom, SWAP_EVENT_TOPIC_BYTES):
+            return False
+        return any(_bloom_contains(logs_bloom, address) for address in self.pairs)
+    
+    async def _fetch_swap_logs(self, from_block, to_block, semaphore):
+        """
+        Fetch Swap logs for a block range without blocking the event loop
+        """
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._get_swap_logs, from_block, to_block)
+    
+    def _get_swap_logs(self, from_block, to_block):
+        """
+        Get Swap logs of the monitored pairs for a block range
+        """
+        if not self.pairs:
+            return []
+        
+        return self.w3.eth.get_logs({
+            'fromBlock': from_block,
+            'toBlock': to_block,
+            'address': [pair_info['contract'].address for pair_info in self.pairs.values()],
+            'topics': [SWAP_EVENT_TOPIC]
+        })
+    
+    async def _handle_swap_log(self, log, pair_info=None):
+        """
+        Decode a log from a monitored pair and process it if it is a token buy.
+        Returns True if the log was a buy.
+        """
+        # Check if log is from a monitored pair
+        if pair_info is None:
+            pair_info = self.pairs.get(bytes.fromhex(log['address'][2:]))
+            if pair_info is None:
+                return False
+        
+        # Try to parse the log as a Swap event
+        try:
+            event_args = _decode_swap(log)
+        except Exception:
+            # Not a Swap event or error parsing
+            return False
+        
+        # Check if this is a buy (ETH/WETH to token)
+        if not self._is_token_buy(event_args, pair_info):
+            return False
+        
+        # Skip transactions already processed (overlapping ranges, reorgs, resubscriptions)
+        tx_hash = HexBytes(log['transactionHash']).hex()
+        if tx_hash in self._seen_tx_hashes:
+            self._seen_tx_hashes.move_to_end(tx_hash)
+            return True
+        self._seen_tx_hashes[tx_hash] = None
+        if len(self._seen_tx_hashes) > SEEN_TX_CACHE_SIZE:
+            self._seen_tx_hashes.popitem(last=False)
+        
+        await self._process_buy_event(
+            tx_hash,
+            event_args,
+            pair_info,
+            await self._resolve_buyer(log, event_args)
+        )
+        return True
+    
+    async def _resolve_buyer(self, log, event_args):
+        """
+        Get the buyer of a swap without fetching the transaction body.
+        The Swap recipient is the buyer unless a router, an aggregator or the next
+        pair of a multi-hop swap received the tokens, in which case the transaction
+        sender is read from the receipt.
+        """
+        recipient = event_args['to']
+        recipient_bytes = bytes.fromhex(recipient[2:])
+        if recipient_bytes not in SWAP_ROUTER_BYTES and recipient_bytes not in self.pairs:
+            return recipient
+        
+        try:
+            loop = asyncio.get_running_loop()
+            receipt = await loop.run_in_executor(None, self.w3.eth.get_transaction_receipt, log['transactionHash'])
+            return receipt['from']
         except Exception as e:
-            print(f"Error checking block {block_number}: {e}")
+            logger.error("Error getting sender of tx %s: %s", HexBytes(log['transactionHash']).hex(), e)
+            return recipient
     
-    def _is_token_buy(self, event_args, token_address):
+    def _normalize_log(self, log):
+        """
+        Convert a raw JSON-RPC log into the form expected by web3 event decoding
+        """
+        return AttributeDict({
+            **log,
+            'topics': [HexBytes(topic) for topic in log['topics']],
+            'data': HexBytes(log['data']),
+            'transactionHash': HexBytes(log['transactionHash']),
+            'blockHash': HexBytes(log['blockHash']),
+            'blockNumber': int(log['blockNumber'], 16),
+            'logIndex': int(log['logIndex'], 16),
+            'transactionIndex': int(log['transactionIndex'], 16)
+        })
+    
+    def _is_token_buy(self, event_args, pair_info):
         """
         Determine if a swap event is a token buy (ETH/WETH to token)
         """
-        # For a buy: amount0In or amount1In should be WETH, and amount0Out or amount1Out should be token
-        # This is a simplified check and might need adjustment based on pair order
-        if event_args['amount0In'] > 0 and event_args['amount1Out'] > 0:
-            # WETH is token0, target token is token1
-            return True
-        elif event_args['amount1In'] > 0 and event_args['amount0Out'] > 0:
-            # WETH is token1, target token is token0
-            return True
-        return False
+        eth_in, token_out = BUY_AMOUNT_KEYS[pair_info['weth_is_token0']]
+        return event_args[eth_in] > 0 and event_args[token_out] > 0
     
     async def _process_buy_event(self, tx_hash, event_args, pair_info, buyer_address):
         """
         Process a token buy event
         """
         try:
-            print(f"Processing buy event for tx: {tx_hash}, buyer: {buyer_address}")
+            logger.info("Processing buy event for tx: %s, buyer: %s", tx_hash, buyer_address)
             # Extract event data
             token_address = pair_info['token_address']
             token_name = pair_info['token_name']
             token_symbol = pair_info['token_symbol']
-            token_decimals = pair_info['token_decimals']
+            token_scale = pair_info['token_scale']
             
             # Calculate amounts
-            eth_amount = 0
-            token_amount = 0
-            
-            if event_args['amount0In'] > 0 and event_args['amount1Out'] > 0:
-                # WETH is token0, target token is token1
-                eth_amount = event_args['amount0In'] / 10**18  # WETH has 18 decimals
-                token_amount = event_args['amount1Out'] / 10**token_decimals
-            elif event_args['amount1In'] > 0 and event_args['amount0Out'] > 0:
-                # WETH is token1, target token is token0
-                eth_amount = event_args['amount1In'] / 10**18  # WETH has 18 decimals
-                token_amount = event_args['amount0Out'] / 10**token_decimals
+            eth_in, token_out = BUY_AMOUNT_KEYS[pair_info['weth_is_token0']]
+            eth_amount = event_args[eth_in] / WETH_SCALE
+            token_amount = event_args[token_out] / token_scale
             
-            # Get token price information from DexData if available
-            token_info = None
-            if hasattr(self, 'dex_data'):
-                token_info = self.dex_data.get_token_info(token_address)
+            # Token price information is only needed for pattern detection,
+            # so fetch it in the background and only when it will be used
+            token_info_task = None
+            if self.db and self.pattern_detector:
+                token_info_task = asyncio.create_task(self.dex_data.get_token_info(token_address))
             
             # Create buy event data
             buy_event = {
@@ -249,11 +625,12 @@ class BlockchainListener:
                 'token_symbol': token_symbol,
                 'eth_amount': eth_amount,
                 'token_amount': token_amount,
-                'timestamp': datetime.now().timestamp()
+                'timestamp': time.time()
             }
             
             # Store token price for pattern detection if available
-            if hasattr(self, 'db') and hasattr(self, 'pattern_detector') and token_info and 'price_usd' in token_info and token_info['price_usd']:
+            token_info = await token_info_task if token_info_task else None
+            if token_info and token_info.get('price_usd'):
                 self.db.store_token_price(
                     token_address,
                     float(token_info['price_usd']),
@@ -267,8 +644,8 @@ class BlockchainListener:
             
             # Call the callback function with the buy event
             # Tambahkan log sebelum memanggil callback
-            print(f"Calling callback with buy event: {buy_event}")
+            logger.debug("Calling callback with buy event: %r", buy_event)
             await self.callback(buy_event)
-            print(f"Callback completed for tx: {tx_hash}")
+            logger.debug("Callback completed for tx: %s", tx_hash)
         except Exception as e:
-            print(f"Error processing buy event: {e}")
\ No newline at end of file
+            logger.error("Error processing buy event: %s", e)
\ No newline at end of file
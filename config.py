@@ -9,22 +9,49 @@ load_dotenv()
 # Telegram Bot Configuration
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 ADMIN_USER_ID = int(os.getenv('ADMIN_USER_ID', 0))
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')  # Optional public HTTPS URL, enables webhook mode
+TELEGRAM_WEBHOOK_LISTEN = os.getenv('TELEGRAM_WEBHOOK_LISTEN', '0.0.0.0')
+TELEGRAM_WEBHOOK_PORT = int(os.getenv('TELEGRAM_WEBHOOK_PORT', 8443))
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET') or None
 
 # Ethereum Configuration
 ETH_NODE_URL = os.getenv('ETH_NODE_URL')
+ETH_NODE_WS_URL = os.getenv('ETH_NODE_WS_URL')  # Optional, enables log subscriptions
 TOKEN_ADDRESSES = os.getenv('TOKEN_ADDRESSES', '').split(',')
 
 # API Keys
 ETHPLORER_API_KEY = os.getenv('ETHPLORER_API_KEY')
+ETHPLORER_RPS = float(os.getenv('ETHPLORER_RPS', 2))  # Requests per second allowed by the key
 
 # Uniswap Contracts
 UNISWAP_V2_FACTORY = '0x5C69bEe701ef814a2B6a3EDD4B1652CB9cc5aA6f'
 UNISWAP_V2_ROUTER = '0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D'
 UNISWAP_V3_FACTORY = '0x1F98431c8aD98523631AE4a59f267346ea31F984'
 
+# Routers and aggregators that receive swap output and forward it to the buyer
+SWAP_ROUTERS = (
+    UNISWAP_V2_ROUTER,
+    '0xEf1c6E67703c7BD7107eed8303Fbe6EC2554BF6B',  # Uniswap Universal Router (v1)
+    '0x3fC91A3afd70395Cd496C647d5a6CC9D4B2b7FAD',  # Uniswap Universal Router
+    '0xd9e1cE17f2641f24aE83637ab66a2cca9C378B9F',  # SushiSwap Router
+    '0x1111111254EEB25477B68fb85Ed929f73A960582',  # 1inch Aggregation Router v5
+    '0xDef1C0ded9bec7F1a1670819833240f027b25EfF',  # 0x Exchange Proxy
+    '0xDEF171Fe48CF0115B1d80b88dc8eAB59176FEe57',  # ParaSwap Augustus v5
+    '0x881D40237659C251811CEC9c364ef91dC08D300C',  # MetaMask Swap Router
+)
+
 # WETH Address
 WETH_ADDRESS = '0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2'
 
+# Precomputed address forms (the constants above are already checksummed)
+SWAP_ROUTER_BYTES = frozenset(bytes.fromhex(router[2:]) for router in SWAP_ROUTERS)
+WETH_ADDRESS_LOWER = WETH_ADDRESS.lower()
+WETH_ADDRESS_BYTES = bytes.fromhex(WETH_ADDRESS[2:])
+
+# (connect, read) timeouts in seconds for node RPC and Ethplorer requests; connect is
+# just over the 3s TCP retransmission window
+HTTP_REQUEST_TIMEOUT = (3.05, 10)
+
 # Database Configuration
 DATABASE_PATH = 'bot_data.db'
 
@@ -35,7 +62,7 @@ DEXSCREENER_API_URL = 'https://api.dexscreener.com/latest/dex'
 ETHPLORER_API_URL = 'https://api.ethplorer.io'
 
 # Etherscan URLs
-ETHERSCAN_TX_URL = 'https://etherscan.io/tx/0x'
+ETHERSCAN_TX_URL = 'https://etherscan.io/tx/'  # Transaction hashes already carry the 0x prefix
 ETHERSCAN_ADDRESS_URL = 'https://etherscan.io/address/'
 
 # Fresh wallet threshold (in days)
@@ -2,15 +2,133 @@
 
 import sqlite3
 import json
+import hashlib
+import math
+import time
+import threading
+import logging
+from array import array
+from contextlib import contextmanager
 from config import DATABASE_PATH
 
+# Sizing of the in-memory filter of processed transaction hashes
+TX_BLOOM_CAPACITY = 2_000_000
+TX_BLOOM_ERROR_RATE = 0.001
+
+# Bumped whenever existing tables need to be rebuilt by _migrate_schema()
+SCHEMA_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings using double hashing.
+    Membership tests may give false positives but never false negatives.
+    """
+    def __init__(self, capacity, error_rate):
+        self.size = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+    
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+    
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+    
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
 class Database:
+    # Hot-path statements, kept as constants so they always hit the statement cache
+    _SQL_TX_EXISTS = 'SELECT 1 FROM processed_transactions WHERE tx_hash = ?'
+    _SQL_TX_INSERT_IGNORE = 'INSERT OR IGNORE INTO processed_transactions (tx_hash) VALUES (?)'
+    _SQL_WALLET_FIRST_TX = 'SELECT first_tx_timestamp FROM wallet_first_tx WHERE address = ?'
+    _SQL_WALLET_FIRST_TX_INSERT = 'INSERT OR IGNORE INTO wallet_first_tx (address, first_tx_timestamp) VALUES (?, ?)'
+    _SQL_PRICE_INSERT = 'INSERT OR IGNORE INTO token_price_history (token_address, timestamp, price_usd, volume_usd) VALUES (?, ?, ?, ?)'
+    # Clustered by primary key; the price history key covers every lookup by token and time
+    _DDL_PROCESSED_TRANSACTIONS = '''
+        CREATE TABLE IF NOT EXISTS processed_transactions (
+            tx_hash TEXT PRIMARY KEY,
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+        '''
+    _DDL_TOKEN_PRICE_HISTORY = '''
+        CREATE TABLE IF NOT EXISTS token_price_history (
+            token_address TEXT,
+            timestamp INTEGER,
+            price_usd REAL,
+            volume_usd REAL,
+            PRIMARY KEY (token_address, timestamp)
+        ) WITHOUT ROWID
+        '''
+    _SQL_PRICE_HISTORY = (
+        'SELECT timestamp, price_usd, volume_usd FROM token_price_history '
+        'WHERE token_address = ? AND timestamp >= ? ORDER BY timestamp'
+    )
+    
     def __init__(self):
-        self.conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+        # Each thread gets its own connection so WAL readers do not serialize on one handle
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self._create_tables()
+        self._load_tx_bloom()
+        self._load_lookup_caches()
+    
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.cursor = conn.cursor()
+            self._local.in_batch = False
+        return conn
+    
+    @property
+    def cursor(self):
+        self.conn
+        return self._local.cursor
+    
+    @property
+    def _in_batch(self):
+        self.conn
+        return self._local.in_batch
+    
+    @_in_batch.setter
+    def _in_batch(self, value):
+        self.conn
+        self._local.in_batch = value
+    
+    def _connect(self):
+        # Autocommit mode; multi-statement transactions are opened explicitly.
+        # check_same_thread is off only so close() can release every thread's connection.
+        conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False, isolation_level=None, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        self._configure(conn)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+    
+    def _configure(self, conn):
+        # WAL lets readers run alongside the writer and NORMAL sync avoids an fsync per commit
+        conn.executescript('''
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-65536;
+        PRAGMA mmap_size=268435456;
+        PRAGMA busy_timeout=5000;
+        ''')
     
     def _create_tables(self):
+        self._migrate_schema()
+        
         # Create table for registered groups
         self.cursor.execute('''
         CREATE TABLE IF NOT EXISTS registered_groups (
@@ -32,23 +150,10 @@ class Database:
         ''')
         
         # Create table for processed transactions to avoid duplicates
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS processed_transactions (
-            tx_hash TEXT PRIMARY KEY,
-            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
+        self.cursor.execute(self._DDL_PROCESSED_TRANSACTIONS)
         
         # Create table for token price history
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS token_price_history (
-            token_address TEXT,
-            timestamp INTEGER,
-            price_usd REAL,
-            volume_usd REAL,
-            PRIMARY KEY (token_address, timestamp)
-        )
-        ''')
+        self.cursor.execute(self._DDL_TOKEN_PRICE_HISTORY)
         
         # Create table for detected trading patterns
         self.cursor.execute('''
@@ -63,40 +168,137 @@ class Database:
             percent_change REAL,
             volume_change REAL,
             wallet_count INTEGER,
-            detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            detected_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))  -- epoch seconds
         )
         ''')
         
+        # Older databases stored detected_at as a text timestamp
+        self.cursor.execute('''
+        UPDATE trading_patterns SET detected_at = CAST(strftime('%s', detected_at) AS INTEGER)
+        WHERE typeof(detected_at) = 'text'
+        ''')
+        
+        self.cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tp_recent
+        ON trading_patterns (detected_at DESC, token_address, pattern_type)
+        ''')
+        
+        # Create table for the first transaction time of analyzed wallets, which never changes
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS wallet_first_tx (
+            address TEXT PRIMARY KEY,
+            first_tx_timestamp INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''')
+        
+        # The query planner needs statistics to pick the right index
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+        if self.cursor.fetchone() is None:
+            self.cursor.execute('ANALYZE')
+        
         self.conn.commit()
     
+    def _migrate_schema(self):
+        if self.cursor.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            return
+        
+        with self.write_batch():
+            # Version 1: rebuild the lookup tables as WITHOUT ROWID so rows are clustered by primary key
+            for table, ddl, columns in (
+                ('processed_transactions', self._DDL_PROCESSED_TRANSACTIONS, 'tx_hash, processed_at'),
+                ('token_price_history', self._DDL_TOKEN_PRICE_HISTORY, 'token_address, timestamp, price_usd, volume_usd'),
+            ):
+                self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+                if self.cursor.fetchone() is None:
+                    continue
+                self.cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_rowid')
+                self.cursor.execute(ddl)
+                self.cursor.execute(f'INSERT OR IGNORE INTO {table} ({columns}) SELECT {columns} FROM {table}_rowid')
+                self.cursor.execute(f'DROP TABLE {table}_rowid')
+            
+            self.cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    
+    def _load_tx_bloom(self):
+        # Negative lookups of processed transactions are answered from memory
+        self._tx_bloom = BloomFilter(TX_BLOOM_CAPACITY, TX_BLOOM_ERROR_RATE)
+        for (tx_hash,) in self.conn.execute('SELECT tx_hash FROM processed_transactions'):
+            self._tx_bloom.add(tx_hash)
+    
+    def _load_lookup_caches(self):
+        # Groups and tokens change rarely but are read on every alert, so keep them in memory
+        self._cache_lock = threading.Lock()
+        self._groups = {row[0]: None for row in self.conn.execute('SELECT chat_id FROM registered_groups')}
+        self._tokens = {
+            row[0]: tuple(row)
+            for row in self.conn.execute('SELECT token_address, token_name, token_symbol FROM monitored_tokens')
+        }
+        # Immutable snapshots handed to readers, rebuilt only after a change
+        self._groups_snapshot = None
+        self._tokens_snapshot = None
+    
+    def _commit(self):
+        # Writes inside write_batch() are committed together when the batch ends
+        if not self._in_batch:
+            self.conn.commit()
+    
+    @contextmanager
+    def write_batch(self):
+        """
+        Group several writes into a single transaction:
+        
+            with db.write_batch():
+                db.mark_transaction_processed(...)
+                db.store_token_price(...)
+        """
+        if self._in_batch:
+            yield self.cursor
+            return
+        
+        self.cursor.execute('BEGIN')
+        self._in_batch = True
+        try:
+            yield self.cursor
+        except Exception:
+            self.conn.rollback()
+            raise
+        else:
+            self.conn.commit()
+        finally:
+            self._in_batch = False
+    
     def register_group(self, chat_id, chat_title, registered_by):
         try:
             self.cursor.execute(
                 'INSERT OR REPLACE INTO registered_groups (chat_id, chat_title, registered_by) VALUES (?, ?, ?)',
                 (chat_id, chat_title, registered_by)
             )
-            self.conn.commit()
+            self._commit()
+            with self._cache_lock:
+                self._groups[chat_id] = None
+                self._groups_snapshot = None
             return True
-        except Exception as e:
-            print(f"Error registering group: {e}")
+        except Exception:
+            logger.exception("register_group failed")
             return False
     
     def unregister_group(self, chat_id):
         try:
             self.cursor.execute('DELETE FROM registered_groups WHERE chat_id = ?', (chat_id,))
-            self.conn.commit()
+            self._commit()
+            with self._cache_lock:
+                self._groups.pop(chat_id, None)
+                self._groups_snapshot = None
             return True
-        except Exception as e:
-            print(f"Error unregistering group: {e}")
+        except Exception:
+            logger.exception("unregister_group failed")
             return False
     
     def get_registered_groups(self):
-        try:
-            self.cursor.execute('SELECT chat_id FROM registered_groups')
-            return [row[0] for row in self.cursor.fetchall()]
-        except Exception as e:
-            print(f"Error getting registered groups: {e}")
-            return []
+        groups = self._groups_snapshot
+        if groups is None:
+            with self._cache_lock:
+                groups = self._groups_snapshot = tuple(self._groups)
+        return groups
     
     def add_token(self, token_address, token_name, token_symbol):
         try:
@@ -104,70 +306,196 @@ class Database:
                 'INSERT OR REPLACE INTO monitored_tokens (token_address, token_name, token_symbol) VALUES (?, ?, ?)',
                 (token_address, token_name, token_symbol)
             )
-            self.conn.commit()
+            self._commit()
+            with self._cache_lock:
+                self._tokens.pop(token_address, None)
+                self._tokens[token_address] = (token_address, token_name, token_symbol)
+                self._tokens_snapshot = None
             return True
-        except Exception as e:
-            print(f"Error adding token: {e}")
+        except Exception:
+            logger.exception("add_token failed")
             return False
     
     def remove_token(self, token_address):
         try:
             self.cursor.execute('DELETE FROM monitored_tokens WHERE token_address = ?', (token_address,))
-            self.conn.commit()
+            self._commit()
+            with self._cache_lock:
+                self._tokens.pop(token_address, None)
+                self._tokens_snapshot = None
             return True
-        except Exception as e:
-            print(f"Error removing token: {e}")
+        except Exception:
+            logger.exception("remove_token failed")
             return False
     
     def get_monitored_tokens(self):
-        try:
-            self.cursor.execute('SELECT token_address, token_name, token_symbol FROM monitored_tokens')
-            return self.cursor.fetchall()
-        except Exception as e:
-            print(f"Error getting monitored tokens: {e}")
-            return []
+        tokens = self._tokens_snapshot
+        if tokens is None:
+            with self._cache_lock:
+                tokens = self._tokens_snapshot = tuple(self._tokens.values())
+        return tokens
     
     def is_transaction_processed(self, tx_hash):
-        self.cursor.execute('SELECT 1 FROM processed_transactions WHERE tx_hash = ?', (tx_hash,))
+        if tx_hash not in self._tx_bloom:
+            return False
+        self.cursor.execute(self._SQL_TX_EXISTS, (tx_hash,))
         return self.cursor.fetchone() is not None
     
     def mark_transaction_processed(self, tx_hash):
         try:
-            self.cursor.execute('INSERT INTO processed_transactions (tx_hash) VALUES (?)', (tx_hash,))
-            self.conn.commit()
+            self.cursor.execute(self._SQL_TX_INSERT_IGNORE, (tx_hash,))
+            self._commit()
+            self._tx_bloom.add(tx_hash)
+            return True
+        except Exception:
+            logger.exception("mark_transaction_processed failed")
+            return False
+    
+    def mark_transactions_processed(self, tx_hashes):
+        try:
+            with self.write_batch():
+                self.cursor.executemany(self._SQL_TX_INSERT_IGNORE, [(tx_hash,) for tx_hash in tx_hashes])
+            for tx_hash in tx_hashes:
+                self._tx_bloom.add(tx_hash)
+            return True
+        except Exception:
+            logger.exception("mark_transactions_processed failed")
+            return False
+    
+    def get_wallet_first_tx(self, address):
+        row = self.conn.execute(self._SQL_WALLET_FIRST_TX, (address.lower(),)).fetchone()
+        return row[0] if row else None
+    
+    def store_wallet_first_tx(self, address, timestamp):
+        try:
+            self.cursor.execute(self._SQL_WALLET_FIRST_TX_INSERT, (address.lower(), timestamp))
+            self._commit()
             return True
-        except Exception as e:
-            print(f"Error marking transaction as processed: {e}")
+        except Exception:
+            logger.exception("store_wallet_first_tx failed")
             return False
     
     def close(self):
-        self.conn.close()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
     
     # Add methods to store and retrieve price history
     def store_token_price(self, token_address, price_usd, volume_usd):
+        return self.store_token_prices([(token_address, int(time.time()), price_usd, volume_usd)])
+    
+    def store_token_prices(self, rows):
+        """
+        Store (token_address, timestamp, price_usd, volume_usd) samples in one transaction.
+        A second sample for the same token and second is ignored.
+        """
         try:
-            timestamp = int(datetime.now().timestamp())
-            self.cursor.execute(
-                'INSERT OR REPLACE INTO token_price_history (token_address, timestamp, price_usd, volume_usd) VALUES (?, ?, ?, ?)',
-                (token_address, timestamp, price_usd, volume_usd)
-            )
-            self.conn.commit()
+            with self.write_batch():
+                self.cursor.executemany(self._SQL_PRICE_INSERT, rows)
             return True
-        except Exception as e:
-            print(f"Error storing token price: {e}")
+        except Exception:
+            logger.exception("store_token_prices failed")
             return False
     
     def get_token_price_history(self, token_address, hours=24):
-        try:
-            timestamp_threshold = int((datetime.now() - timedelta(hours=hours)).timestamp())
-            self.cursor.execute(
-                'SELECT timestamp, price_usd, volume_usd FROM token_price_history WHERE token_address = ? AND timestamp >= ? ORDER BY timestamp',
-                (token_address, timestamp_threshold)
-            )
-            return self.cursor.fetchall()
-        except Exception as e:
-            print(f"Error getting token price history: {e}")
-            return []
+        timestamp_threshold = int(time.time()) - hours * 3600
+        self.cursor.execute(self._SQL_PRICE_HISTORY, (token_address, timestamp_threshold))
+        return self.cursor.fetchall()
+    
+    def get_token_price_columns(self, token_address, hours=24):
+        """
+        Same window as get_token_price_history, returned as parallel
+        (timestamps, prices, volumes) arrays instead of one row per sample
+        """
+        timestamps, prices, volumes = array('q'), array('d'), array('d')
+        timestamp_threshold = int(time.time()) - hours * 3600
+        for timestamp, price_usd, volume_usd in self.conn.execute(self._SQL_PRICE_HISTORY, (token_address, timestamp_threshold)):
+            timestamps.append(timestamp)
+            prices.append(price_usd)
+            volumes.append(volume_usd)
+        return timestamps, prices, volumes
+    
+    def get_price_stats(self, token_address, hours=24):
+        """
+        Summarize the price history of a token around its peak price:
+        the peak, the lowest price before and after it, the average volume
+        before it and the maximum volume of the window. The reductions run
+        in SQLite over the clustered primary key so only scalars are returned.
+        """
+        timestamp_threshold = int(time.time()) - hours * 3600
+        window = (token_address, timestamp_threshold)
+        
+        self.cursor.execute(
+            'SELECT COUNT(*), MAX(volume_usd) FROM token_price_history WHERE token_address = ? AND timestamp >= ?',
+            window
+        )
+        sample_count, max_volume = self.cursor.fetchone()
+        if not sample_count:
+            return None
+        
+        # Earliest sample with the highest price
+        self.cursor.execute(
+            '''SELECT timestamp, price_usd, volume_usd FROM token_price_history
+               WHERE token_address = ? AND timestamp >= ? ORDER BY price_usd DESC, timestamp LIMIT 1''',
+            window
+        )
+        peak_time, peak_price, peak_volume = self.cursor.fetchone()
+        
+        # Earliest samples with the lowest price before and after the peak
+        self.cursor.execute(
+            '''SELECT timestamp, price_usd FROM token_price_history
+               WHERE token_address = ? AND timestamp >= ? AND timestamp < ? ORDER BY price_usd, timestamp LIMIT 1''',
+            (*window, peak_time)
+        )
+        min_before = self.cursor.fetchone() or (peak_time, peak_price)
+        
+        self.cursor.execute(
+            '''SELECT timestamp, price_usd FROM token_price_history
+               WHERE token_address = ? AND timestamp > ? ORDER BY price_usd, timestamp LIMIT 1''',
+            (token_address, peak_time)
+        )
+        min_after = self.cursor.fetchone() or (peak_time, peak_price)
+        
+        self.cursor.execute(
+            '''SELECT AVG(volume_usd) FROM token_price_history
+               WHERE token_address = ? AND timestamp >= ? AND timestamp < ?''',
+            (*window, peak_time)
+        )
+        avg_volume_before = self.cursor.fetchone()[0]
+        
+        return {
+            'sample_count': sample_count,
+            'peak_time': peak_time,
+            'peak_price': peak_price,
+            'min_before_time': min_before[0],
+            'min_before_price': min_before[1],
+            'min_after_time': min_after[0],
+            'min_after_price': min_after[1],
+            # With no samples before the peak, the peak is the first sample
+            'avg_volume_before': avg_volume_before if avg_volume_before is not None else peak_volume,
+            'max_volume': max_volume
+        }
+    
+    def get_price_volatility(self, token_address, hours=24):
+        """
+        Return (sample_count, coefficient of variation in percent) of the
+        token's prices over the window, aggregated inside SQLite.
+        """
+        timestamp_threshold = int(time.time()) - hours * 3600
+        self.cursor.execute(
+            '''SELECT COUNT(*), AVG(price_usd), AVG(price_usd * price_usd) FROM token_price_history
+               WHERE token_address = ? AND timestamp >= ?''',
+            (token_address, timestamp_threshold)
+        )
+        sample_count, mean, mean_square = self.cursor.fetchone()
+        if not sample_count or not mean:
+            return sample_count, None
+        
+        # Population standard deviation, clamped against rounding below zero
+        std = math.sqrt(max(mean_square - mean * mean, 0))
+        return sample_count, std / mean * 100
     
     def store_trading_pattern(self, token_address, pattern_type, start_timestamp, end_timestamp, 
                              start_price, end_price, percent_change, volume_change, wallet_count):
@@ -175,35 +503,31 @@ class Database:
             self.cursor.execute(
                 '''INSERT INTO trading_patterns 
                    (token_address, pattern_type, start_timestamp, end_timestamp, start_price, end_price, 
-                    percent_change, volume_change, wallet_count) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    percent_change, volume_change, wallet_count, detected_at) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                 (token_address, pattern_type, start_timestamp, end_timestamp, start_price, end_price, 
-                 percent_change, volume_change, wallet_count)
+                 percent_change, volume_change, wallet_count, int(time.time()))
             )
-            self.conn.commit()
+            self._commit()
             return self.cursor.lastrowid
-        except Exception as e:
-            print(f"Error storing trading pattern: {e}")
+        except Exception:
+            logger.exception("store_trading_pattern failed")
             return None
     
     def get_recent_patterns(self, token_address=None, pattern_type=None, hours=24):
-        try:
-            timestamp_threshold = int((datetime.now() - timedelta(hours=hours)).timestamp())
-            query = 'SELECT * FROM trading_patterns WHERE detected_at >= datetime(?, "unixepoch")'
-            params = [timestamp_threshold]
-            
-            if token_address:
-                query += ' AND token_address = ?'
-                params.append(token_address)
-            
-            if pattern_type:
-                query += ' AND pattern_type = ?'
-                params.append(pattern_type)
-                
-            query += ' ORDER BY detected_at DESC'
+        timestamp_threshold = int(time.time()) - hours * 3600
+        query = 'SELECT * FROM trading_patterns WHERE detected_at >= ?'
+        params = [timestamp_threshold]
+        
+        if token_address:
+            query += ' AND token_address = ?'
+            params.append(token_address)
+        
+        if pattern_type:
+            query += ' AND pattern_type = ?'
+            params.append(pattern_type)
             
-            self.cursor.execute(query, params)
-            return self.cursor.fetchall()
-        except Exception as e:
-            print(f"Error getting recent patterns: {e}")
-            return []
\ No newline at end of file
+        query += ' ORDER BY detected_at DESC'
+        
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
@@ -1,52 +1,192 @@
 # Module for fetching data from DexScreener API
 
-import requests
-import json
-from config import DEXSCREENER_API_URL
+import asyncio
+import logging
+import time
+import aiohttp
+from collections import OrderedDict
+import orjson
+from config import DEXSCREENER_API_URL, WETH_ADDRESS
+
+logger = logging.getLogger(__name__)
+
+# Seconds a token info response is reused before DexScreener is queried again
+TOKEN_INFO_TTL = 30
+
+# Maximum number of token info responses kept in memory
+TOKEN_INFO_CACHE_SIZE = 4096
+
+# Maximum number of addresses DexScreener accepts per tokens request
+TOKENS_PER_REQUEST = 30
+
+# Seconds the ETH price is reused (roughly one block)
+ETH_PRICE_TTL = 10
 
 class DexData:
     def __init__(self):
         self.api_url = DEXSCREENER_API_URL
+        self._token_info_cache = OrderedDict()
+        self._eth_price_cache = (0, None)
+        self._inflight = {}
+        self._session = None
     
-    def get_token_info(self, token_address):
+    async def get_token_info(self, token_address):
         """
         Get token information from DexScreener API
         """
+        # Lowercase once; the cache, the in-flight key and the request all use this form
+        token_address = token_address.lower()
+        cached = self._get_cached_token_info(token_address)
+        if cached is not None:
+            return cached
+        
+        return await self._fetch_once(('token_info', token_address), lambda: self._fetch_token_info(token_address))
+    
+    async def _fetch_token_info(self, token_address):
         try:
-            url = f"{self.api_url}/tokens/{token_address}"
-            response = requests.get(url)
-            data = response.json()
-            
-            if 'pairs' not in data or not data['pairs']:
-                return None
+            data = await self._get_json(f"{self.api_url}/tokens/{token_address}")
+            return self._cache_token_info(token_address, self._parse_token_info(data))
+        except Exception as e:
+            logger.error("Error fetching token info from DexScreener: %s", e)
+            return None
+    
+    async def _fetch_once(self, key, fetch):
+        """
+        Share one in-flight request between concurrent callers asking for the same key
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so a cancelled caller does not cancel the request for the others
+        return await asyncio.shield(task)
+    
+    async def _get_json(self, url):
+        """
+        GET a DexScreener endpoint over the pooled session and decode the JSON body
+        """
+        session = await self.get_session()
+        async with session.get(url) as response:
+            return orjson.loads(await response.read())
+    
+    async def get_session(self):
+        """
+        Get the pooled aiohttp session, creating it on first use.
+        The Telegram bot sends its Bot API requests over the same session.
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=75),
+                timeout=aiohttp.ClientTimeout(total=5)
+            )
+        return self._session
+    
+    async def close(self):
+        """
+        Close the aiohttp session
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+    
+    def _get_cached_token_info(self, token_address):
+        # token_address is already lowercase
+        entry = self._token_info_cache.get(token_address)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+    
+    def _cache_token_info(self, token_address, token_info):
+        # token_address is already lowercase
+        if token_info is not None:
+            self._token_info_cache[token_address] = (time.monotonic() + TOKEN_INFO_TTL, token_info)
+            self._token_info_cache.move_to_end(token_address)
+            if len(self._token_info_cache) > TOKEN_INFO_CACHE_SIZE:
+                self._token_info_cache.popitem(last=False)
+        return token_info
+    
+    async def get_tokens_info(self, token_addresses):
+        """
+        Get token information for several tokens, keyed by lowercase address.
+        Uncached tokens are fetched with DexScreener's multi-address endpoint.
+        """
+        tokens_info = {}
+        missing = []
+        for token_address in dict.fromkeys(address.lower() for address in token_addresses):
+            cached = self._get_cached_token_info(token_address)
+            if cached is not None:
+                tokens_info[token_address] = cached
+            else:
+                missing.append(token_address)
+        
+        for i in range(0, len(missing), TOKENS_PER_REQUEST):
+            batch = missing[i:i + TOKENS_PER_REQUEST]
+            try:
+                data = await self._get_json(f"{self.api_url}/tokens/{','.join(batch)}")
+            except Exception as e:
+                logger.error("Error fetching tokens info from DexScreener: %s", e)
+                continue
             
-            # Get the first pair (usually the most liquid one)
-            pair = data['pairs'][0]
+            # Keep the most liquid pair of each requested token
+            best_pairs = {}
+            for pair in data.get('pairs') or []:
+                token_address = (pair.get('baseToken', {}).get('address') or '').lower()
+                best = best_pairs.get(token_address)
+                if best is None or self._pair_liquidity(pair) > self._pair_liquidity(best):
+                    best_pairs[token_address] = pair
             
-            return {
-                'name': pair.get('baseToken', {}).get('name'),
-                'symbol': pair.get('baseToken', {}).get('symbol'),
-                'price_usd': pair.get('priceUsd'),
-                'price_eth': pair.get('priceNative'),
-                'liquidity_usd': pair.get('liquidity', {}).get('usd'),
-                'fdv': pair.get('fdv'),  # Fully Diluted Valuation
-                'market_cap': pair.get('marketCap'),
-                'holders': None,  # DexScreener doesn't provide holders count
-                'dexscreener_url': f"https://dexscreener.com/ethereum/{pair.get('pairAddress')}"
-            }
-        except Exception as e:
-            print(f"Error fetching token info from DexScreener: {e}")
+            for token_address in batch:
+                if token_address in best_pairs:
+                    tokens_info[token_address] = self._cache_token_info(token_address, self._format_pair(best_pairs[token_address]))
+        
+        return tokens_info
+    
+    def _pair_liquidity(self, pair):
+        return (pair.get('liquidity') or {}).get('usd') or 0
+    
+    def _parse_token_info(self, data):
+        """
+        Extract token information from a DexScreener tokens response
+        """
+        if 'pairs' not in data or not data['pairs']:
             return None
+        
+        # Get the first pair (usually the most liquid one)
+        return self._format_pair(data['pairs'][0])
     
-    def get_eth_price(self):
+    def _format_pair(self, pair):
+        """
+        Build the token information dict from a DexScreener pair
+        """
+        return {
+            'name': pair.get('baseToken', {}).get('name'),
+            'symbol': pair.get('baseToken', {}).get('symbol'),
+            'price_usd': pair.get('priceUsd'),
+            'price_eth': pair.get('priceNative'),
+            'liquidity_usd': pair.get('liquidity', {}).get('usd'),
+            'fdv': pair.get('fdv'),  # Fully Diluted Valuation
+            'market_cap': pair.get('marketCap'),
+            'holders': None,  # DexScreener doesn't provide holders count
+            'dexscreener_url': f"https://dexscreener.com/ethereum/{pair.get('pairAddress')}"
+        }
+    
+    async def get_eth_price(self):
         """
         Get current ETH price in USD
         """
+        expires_at, eth_price = self._eth_price_cache
+        if eth_price is not None and expires_at > time.monotonic():
+            return eth_price
+        
+        eth_price = await self._fetch_once('eth_price', self._fetch_eth_price)
+        if eth_price:
+            self._eth_price_cache = (time.monotonic() + ETH_PRICE_TTL, eth_price)
+        return eth_price
+    
+    async def _fetch_eth_price(self):
         try:
             # Using WETH as a reference
-            url = f"{self.api_url}/tokens/ethereum/0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
-            response = requests.get(url)
-            data = response.json()
+            data = await self._get_json(f"{self.api_url}/tokens/ethereum/{WETH_ADDRESS}")
             
             if 'pairs' not in data or not data['pairs']:
                 return None
@@ -58,5 +198,5 @@ class DexData:
             
             return float(data['pairs'][0].get('priceUsd', 0))
         except Exception as e:
-            print(f"Error fetching ETH price: {e}")
+            logger.error("Error fetching ETH price: %s", e)
             return None
\ No newline at end of file
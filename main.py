@@ -3,7 +3,6 @@
 import asyncio
 import logging
 import signal
-import sys
 from config import TOKEN_ADDRESSES
 from database import Database
 from blockchain_listener import BlockchainListener
@@ -20,15 +19,24 @@ logger = logging.getLogger(__name__)
 bot = None
 blockchain_listener = None
 
+# Seconds the Telegram bot gets to stop polling during shutdown
+SHUTDOWN_TIMEOUT = 10
+
 async def main():
     global bot, blockchain_listener
     
+    # Handle termination signals on the event loop instead of interrupting it
+    loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda sig=sig: asyncio.create_task(shutdown(sig, main_task)))
+    
     try:
         # Initialize database
         db = Database()
         
         # Initialize Telegram bot
-        bot = TelegramBot()
+        bot = TelegramBot(db=db)
         
         # Get monitored tokens from database
         monitored_tokens = db.get_monitored_tokens()
@@ -46,47 +54,47 @@ async def main():
         pattern_detector = PatternDetector(db)
         
         # Perbaiki inisialisasi blockchain_listener
-        blockchain_listener = BlockchainListener(token_addresses, bot.send_buy_alert, db, pattern_detector)
+        blockchain_listener = BlockchainListener(token_addresses, bot.send_buy_alert, db, pattern_detector, bot.dex_data)
         
         # Start the bot
-        bot.start()
+        await bot.start()
         
         # Start listening for blockchain events
         await blockchain_listener.listen_for_swaps()
-    except KeyboardInterrupt:
-        logger.info("Received keyboard interrupt. Shutting down...")
-        cleanup()
+    except asyncio.CancelledError:
+        # Raised once shutdown() has finished cleaning up
+        pass
     except Exception as e:
-        logger.error(f"Error in main function: {e}")
-        cleanup()
+        logger.error("Error in main function: %s", e)
+        await cleanup()
 
-def cleanup():
+async def cleanup():
     """
     Clean up resources before exiting
     """
-    global bot, blockchain_listener
     logger.info("Cleaning up resources...")
     
     if blockchain_listener:
         blockchain_listener.stop()
     
     if bot:
-        bot.stop()
+        try:
+            await asyncio.wait_for(bot.stop(), SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Timed out waiting for the Telegram bot to stop")
     
     logger.info("Cleanup complete. Exiting.")
-    sys.exit(0)
 
-def signal_handler(sig, frame):
+async def shutdown(sig, main_task):
     """
     Handle termination signals
     """
-    logger.info(f"Received signal {sig}. Shutting down...")
-    cleanup()
+    logger.info("Received signal %s. Shutting down...", sig.name)
+    await cleanup()
+    
+    # Cancelling the main task interrupts the listener mid-sleep and lets asyncio.run return
+    main_task.cancel()
 
 if __name__ == "__main__":
-    # Register signal handlers
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    
     # Run the main function
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -1,12 +1,16 @@
 # Module for detecting trading patterns
 
-import numpy as np
-from datetime import datetime, timedelta
+from bisect import bisect_left
+from collections import defaultdict
 from config import PUMP_DUMP_PERCENT_THRESHOLD, PUMP_DUMP_TIME_WINDOW, ACCUMULATION_THRESHOLD, ACCUMULATION_TIME_WINDOW
 
 class PatternDetector:
     def __init__(self, database):
         self.db = database
+        
+        # Fail at startup rather than silently skipping detection on a schema without price history
+        if database.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'token_price_history'").fetchone() is None:
+            raise RuntimeError("Database has no token_price_history table; pattern detection needs it")
     
     def detect_patterns(self, token_address):
         """Detect trading patterns for a specific token"""
@@ -26,46 +30,25 @@ class PatternDetector:
     
     def detect_pump_dump(self, token_address):
         """Detect pump and dump pattern"""
-        # Get price history for the token
-        price_history = self.db.get_token_price_history(token_address, hours=PUMP_DUMP_TIME_WINDOW)
-        if len(price_history) < 2:
+        # Get price history summary for the token, reduced inside the database
+        stats = self.db.get_price_stats(token_address, hours=PUMP_DUMP_TIME_WINDOW)
+        if not stats or stats['sample_count'] < 2:
             return None
         
-        # Convert to numpy arrays for easier analysis
-        timestamps = np.array([p[0] for p in price_history])
-        prices = np.array([p[1] for p in price_history])
-        volumes = np.array([p[2] for p in price_history])
-        
-        # Find maximum price and its index
-        max_price_idx = np.argmax(prices)
-        max_price = prices[max_price_idx]
-        max_price_time = timestamps[max_price_idx]
-        
-        # Find minimum price before the maximum
-        if max_price_idx > 0:
-            min_price_before = np.min(prices[:max_price_idx])
-            min_before_idx = np.argmin(prices[:max_price_idx])
-            min_price_before_time = timestamps[min_before_idx]
-        else:
-            min_price_before = prices[0]
-            min_price_before_time = timestamps[0]
-        
-        # Find minimum price after the maximum
-        if max_price_idx < len(prices) - 1:
-            min_price_after = np.min(prices[max_price_idx+1:])
-            min_after_idx = np.argmin(prices[max_price_idx+1:]) + max_price_idx + 1
-            min_price_after_time = timestamps[min_after_idx]
-        else:
-            min_price_after = prices[-1]
-            min_price_after_time = timestamps[-1]
+        max_price = stats['peak_price']
+        max_price_time = stats['peak_time']
+        min_price_before = stats['min_before_price']
+        min_price_before_time = stats['min_before_time']
+        min_price_after = stats['min_after_price']
+        min_price_after_time = stats['min_after_time']
         
         # Calculate price changes
         pump_percent = ((max_price - min_price_before) / min_price_before * 100) if min_price_before > 0 else 0
         dump_percent = ((max_price - min_price_after) / max_price * 100) if max_price > 0 else 0
         
         # Calculate volume changes
-        avg_volume_before = np.mean(volumes[:max_price_idx]) if max_price_idx > 0 else volumes[0]
-        max_volume = np.max(volumes)
+        avg_volume_before = stats['avg_volume_before']
+        max_volume = stats['max_volume']
         volume_increase = ((max_volume - avg_volume_before) / avg_volume_before * 100) if avg_volume_before > 0 else 0
         
         # Check if this is a pump and dump pattern
@@ -102,35 +85,38 @@ class PatternDetector:
             return None
         
         # Group buys by wallet to find wallets that are accumulating
-        wallet_buys = {}
+        wallet_buys = defaultdict(list)
         for buy in recent_buys:
-            wallet = buy['buyer']
-            if wallet not in wallet_buys:
-                wallet_buys[wallet] = []
-            wallet_buys[wallet].append(buy)
-        
-        # Find wallets with multiple buys
-        accumulating_wallets = {w: buys for w, buys in wallet_buys.items() if len(buys) >= 3}
+            wallet_buys[buy['buyer']].append(buy)
+        
+        # Find wallets with multiple buys and the time span of their buys
+        accumulating_wallets = {}
+        start_time = end_time = None
+        for wallet, buys in wallet_buys.items():
+            if len(buys) < 3:
+                continue
+            accumulating_wallets[wallet] = buys
+            for buy in buys:
+                timestamp = buy['timestamp']
+                if start_time is None or timestamp < start_time:
+                    start_time = timestamp
+                if end_time is None or timestamp > end_time:
+                    end_time = timestamp
         
         if accumulating_wallets:
-            # Get price history to check if price has remained relatively stable
-            price_history = self.db.get_token_price_history(token_address, hours=ACCUMULATION_TIME_WINDOW)
-            if len(price_history) < 2:
+            # Check if price has remained relatively stable, aggregated in the database
+            sample_count, price_volatility = self.db.get_price_volatility(token_address, hours=ACCUMULATION_TIME_WINDOW)
+            if sample_count < 2 or price_volatility is None:
                 return None
             
-            prices = np.array([p[1] for p in price_history])
-            price_volatility = np.std(prices) / np.mean(prices) * 100  # Coefficient of variation as percentage
-            
             # Low volatility (< 15%) suggests accumulation rather than pumping
             if price_volatility < 15:
-                # Get the earliest and latest buy timestamps
-                all_buys = [buy for buys in accumulating_wallets.values() for buy in buys]
-                start_time = min(buy['timestamp'] for buy in all_buys)
-                end_time = max(buy['timestamp'] for buy in all_buys)
+                timestamps, prices, _ = self.db.get_token_price_columns(token_address, hours=ACCUMULATION_TIME_WINDOW)
                 
-                # Get prices at start and end
-                start_price = next((p[1] for p in price_history if p[0] >= start_time), prices[0])
-                end_price = next((p[1] for p in price_history if p[0] <= end_time), prices[-1])
+                # Get prices at start and end; timestamps are sorted so the start is a binary search
+                start_index = bisect_left(timestamps, start_time)
+                start_price = prices[start_index] if start_index < len(prices) else prices[0]
+                end_price = prices[0] if timestamps[0] <= end_time else prices[-1]
                 
                 return {
                     'pattern_type': 'accumulation',
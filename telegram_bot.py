@@ -1,14 +1,26 @@
 # Telegram bot implementation
 
 import asyncio
+import hmac
 import logging
-from datetime import datetime
+import random
+import re
+import secrets
+import time
+from functools import lru_cache
+import aiohttp
+from aiohttp import web
+import orjson
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import CommandHandler, CallbackContext, CallbackQueryHandler, Filters, MessageHandler, Updater
-from web3 import Web3
-import numpy as np
+from telegram.ext import Application, CommandHandler, ContextTypes, filters
 
-from config import TELEGRAM_BOT_TOKEN, ADMIN_USER_ID, ETHERSCAN_TX_URL, ETHERSCAN_ADDRESS_URL
+from config import (
+    TELEGRAM_BOT_TOKEN, ADMIN_USER_ID, ETHERSCAN_TX_URL, ETHERSCAN_ADDRESS_URL,
+    TELEGRAM_WEBHOOK_URL, TELEGRAM_WEBHOOK_LISTEN, TELEGRAM_WEBHOOK_PORT, TELEGRAM_WEBHOOK_SECRET
+)
 from database import Database
 from dex_data import DexData
 from wallet_analyzer import WalletAnalyzer
@@ -19,88 +31,213 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+TELEGRAM_API_URL = 'https://api.telegram.org/bot'
+
+# Telegram allows about 30 messages per second across all chats
+BROADCAST_BATCH_SIZE = 30
+BROADCAST_BATCH_DELAY = 1.0
+
+# Telegram allows about one message per second in a single chat
+CHAT_SEND_INTERVAL = 1.0
+
+# Attempts per message, and the base of the exponential backoff after a network error
+SEND_MAX_ATTEMPTS = 3
+SEND_RETRY_BASE_DELAY = 0.5
+
+# Bot API calls may take longer than the session's default DexScreener timeout
+TELEGRAM_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+# Bot API request bodies are encoded before they reach aiohttp
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# Hex-encoded 20-byte address
+ADDRESS_RE = re.compile(r'0x[0-9a-fA-F]{40}')
+
+def is_address(value):
+    return ADDRESS_RE.fullmatch(value) is not None
+
+# Longest reply sent in one message, below Telegram's 4096 character limit
+MESSAGE_CHUNK_SIZE = 4000
+
+def split_message(message, limit=MESSAGE_CHUNK_SIZE):
+    """Split a message into chunks of at most limit characters, preferably at line ends"""
+    chunks = []
+    current = ''
+    for line in message.splitlines(keepends=True):
+        if current and len(current) + len(line) > limit:
+            chunks.append(current)
+            current = ''
+        while len(line) > limit:
+            chunks.append(line[:limit])
+            line = line[limit:]
+        current += line
+    if current:
+        chunks.append(current)
+    return chunks
+
+@lru_cache(maxsize=1024)
+def format_timestamp(timestamp):
+    """Format an epoch timestamp as local 'YYYY-MM-DD HH:MM' without going through strftime"""
+    tm = time.localtime(timestamp)
+    return f"{tm.tm_year:04d}-{tm.tm_mon:02d}-{tm.tm_mday:02d} {tm.tm_hour:02d}:{tm.tm_min:02d}"
+
+# Buy alert text; {position} is one of the position blocks below
+ALERT_TEMPLATE = (
+    "{token_name} {token_symbol} 🔔 Buy!\n\n"
+    "🤑🤑🤑🤑🤑🤑🤑🤑🤑🤑\n\n"
+    "💰| {eth_amount:,.4f} ETH (${eth_amount_usd:,.2f})\n"
+    "📈| Got: {token_amount} {token_symbol}\n"
+    "👤| Buyer: [Wallet]({address_url}{buyer}) | [Tx]({tx_url}{tx_hash})\n"
+    "{position}"
+    "👥| Holders: {holders}\n"
+    "💲| Market Cap: ${market_cap:,.2f}\n\n"
+    "🧠 Wallet Status: {wallet_status}\n"
+    "🐋 Other Holdings:\n{other_holdings}"
+    "📉 Behavior: {behavior}\n({trading_info})\n\n"
+)
+
+# Position block for a buyer who already traded the token
+ALERT_POSITION_TEMPLATE = (
+    "📊| Position: Swing Trade ({trade_count} trades)\n"
+    "🛒| Bought: {bought_amount} tokens (${bought_value_usd:,.2f})\n"
+    "💹| PNL: ${total_pnl:,.2f} ({pnl_percentage:,.2f}%)\n"
+    "💼| Remaining: {remaining_tokens} tokens (${current_value_usd:,.2f})\n"
+)
+
+# Position block for a first-time buyer
+ALERT_NEW_POSITION = "🆕| Position: New\n"
+
+# Link prefixes of the alert keyboard buttons
+UNISWAP_SWAP_URL = 'https://app.uniswap.org/#/swap?outputCurrency='
+DEXSCREENER_TOKEN_URL = 'https://dexscreener.com/ethereum/'
+DEXTOOLS_PAIR_URL = 'https://www.dextools.io/app/en/ether/pair-explorer/'
+
+# Maximum number of per-token alert keyboards kept in memory
+KEYBOARD_CACHE_SIZE = 1024
+
+# Worker threads for blocking WalletAnalyzer requests
+WALLET_ANALYSIS_WORKERS = 16
+
+# Number of recently alerted transaction hashes remembered in memory
+SEEN_TX_CACHE_SIZE = 131072
+
+# Processed transactions are written in batches of this size, or after this many seconds
+TX_FLUSH_BATCH_SIZE = 50
+TX_FLUSH_INTERVAL = 0.1
+
 class TelegramBot:
-    def __init__(self, token=TELEGRAM_BOT_TOKEN):
+    def __init__(self, token=TELEGRAM_BOT_TOKEN, db=None):
         self.token = token
-        self.updater = Updater(token=token, use_context=True)
-        self.dispatcher = self.updater.dispatcher
-        self.db = Database()
+        # Updates are handled concurrently on the event loop instead of one at a time
+        self.application = Application.builder().token(token).concurrent_updates(True).build()
+        # Share the caller's Database so its per-thread connections and caches are not duplicated
+        self.db = db or Database()
         self.dex_data = DexData()
-        self.wallet_analyzer = WalletAnalyzer()
-        self.w3 = Web3()
+        self.wallet_analyzer = WalletAnalyzer(db=self.db)
+        self._send_semaphore = None
+        self._chat_ready_at = {}
+        self._seen_tx = OrderedDict()
+        self._pending_tx = []
+        self._tx_flush_handle = None
+        self._tx_writes = set()
+        self._keyboard_cache = OrderedDict()
+        self._webhook_runner = None
+        self._webhook_secret = None
+        # Kept apart from the default executor so slow wallet lookups cannot starve log fetching
+        self._wallet_pool = ThreadPoolExecutor(max_workers=WALLET_ANALYSIS_WORKERS, thread_name_prefix='wallet')
         
         # Register handlers
         self._register_handlers()
     
     def _register_handlers(self):
-        # Command handlers
-        self.dispatcher.add_handler(CommandHandler("start", self.start_command))
-        self.dispatcher.add_handler(CommandHandler("help", self.help_command))
-        self.dispatcher.add_handler(CommandHandler("register", self.register_command))
-        self.dispatcher.add_handler(CommandHandler("unregister", self.unregister_command))
-        self.dispatcher.add_handler(CommandHandler("addtoken", self.add_token_command, filters=Filters.user(user_id=ADMIN_USER_ID)))
-        self.dispatcher.add_handler(CommandHandler("removetoken", self.remove_token_command, filters=Filters.user(user_id=ADMIN_USER_ID)))
-        self.dispatcher.add_handler(CommandHandler("listtokens", self.list_tokens_command))
-        self.dispatcher.add_handler(CommandHandler("listgroups", self.list_groups_command, filters=Filters.user(user_id=ADMIN_USER_ID)))
-        self.dispatcher.add_handler(CommandHandler("tokeninfo", self.token_info_command))
-        self.dispatcher.add_handler(CommandHandler("patterns", self.patterns_command))  # Add this line here
-        
-        # Callback query handler
-        self.dispatcher.add_handler(CallbackQueryHandler(self.button_callback))
+        # Command handlers: (command, callback, restricted to the admin).
+        # Admin commands are filtered at dispatch, so their callbacks do not check the user again.
+        commands = [
+            ("start", self.start_command, False),
+            ("help", self.help_command, False),
+            ("register", self.register_command, False),
+            ("unregister", self.unregister_command, False),
+            ("addtoken", self.add_token_command, True),
+            ("removetoken", self.remove_token_command, True),
+            ("listtokens", self.list_tokens_command, False),
+            ("listgroups", self.list_groups_command, True),
+            ("tokeninfo", self.token_info_command, False),
+            ("patterns", self.patterns_command, False),
+        ]
+        admin_filter = filters.User(user_id=ADMIN_USER_ID)
+        self.application.add_handlers([
+            CommandHandler(command, callback, filters=admin_filter if admin_only else None)
+            for command, callback, admin_only in commands
+        ])
         
         # Error handler
-        self.dispatcher.add_error_handler(self.error_handler)
+        self.application.add_error_handler(self.error_handler)
     
     async def send_buy_alert(self, buy_event):
         """
         Send buy alert to all registered groups
         """
         try:
-            print(f"Received buy event: {buy_event}")
+            # Formatting the whole event is only worth it when debug output is on
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Received buy event: %r", buy_event)
             
             # Cek apakah ini adalah heartbeat
             if buy_event.get('is_heartbeat', False):
-                print("This is a heartbeat event")
+                logger.debug("This is a heartbeat event")
                 # Kirim heartbeat hanya ke admin
-                try:
-                    from config import ADMIN_USER_ID
-                    self.updater.bot.send_message(
-                        chat_id=ADMIN_USER_ID,
-                        text=f"🔔 HEARTBEAT: {buy_event['message']}",
-                        parse_mode='Markdown'
-                    )
-                    return
-                except Exception as e:
-                    logger.error(f"Error sending heartbeat to admin: {e}")
-                    return
+                await self._send_message({
+                    'chat_id': ADMIN_USER_ID,
+                    'text': f"🔔 HEARTBEAT: {buy_event['message']}",
+                    'parse_mode': 'Markdown'
+                })
+                return
+            
+            # Claim the transaction: skip it if already processed, otherwise record it right away
+            tx_hash = buy_event['tx_hash']
+            token_address = buy_event['token_address']
+            buyer = buy_event['buyer']
+            eth_amount = buy_event['eth_amount']
+            if not self._claim_transaction(tx_hash):
+                logger.debug("Transaction %s already processed, skipping", tx_hash)
+                return
             
-            # Check if we've already processed this transaction
-            if self.db.is_transaction_processed(buy_event['tx_hash']):
-                print(f"Transaction {buy_event['tx_hash']} already processed, skipping")
+            # Nothing below matters if nobody receives the alert
+            registered_groups = self.db.get_registered_groups()
+            if not registered_groups:
+                logger.debug("No registered groups, skipping alert for %s", tx_hash)
                 return
             
-            print(f"Marking transaction {buy_event['tx_hash']} as processed")
-            # Mark transaction as processed
-            self.db.mark_transaction_processed(buy_event['tx_hash'])
+            # Token info, ETH price and the buyer's wallet are independent, so they run together;
+            # WalletAnalyzer uses blocking HTTP and runs on the wallet thread pool.
+            # A failed lookup becomes None so the fallbacks below still let the alert go out
+            loop = asyncio.get_running_loop()
+            results = await asyncio.gather(
+                self.dex_data.get_token_info(token_address),
+                self.dex_data.get_eth_price(),
+                loop.run_in_executor(self._wallet_pool, self.wallet_analyzer.get_wallet_info, buyer),
+                loop.run_in_executor(self._wallet_pool, self.wallet_analyzer.get_token_trading_info, buyer, token_address),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, BaseException):
+                    logger.error("Lookup for alert %s failed: %s", tx_hash, result)
+            token_info, eth_price_usd, wallet_info, token_trading_info = (
+                None if isinstance(result, BaseException) else result for result in results
+            )
             
-            # Get token info from DexScreener
-            token_info = self.dex_data.get_token_info(buy_event['token_address'])
             if not token_info:
-                logger.error(f"Could not get token info for {buy_event['token_address']}")
+                logger.error("Could not get token info for %s", token_address)
                 return
             
-            # Get ETH price in USD
-            eth_price_usd = self.dex_data.get_eth_price()
             if not eth_price_usd:
                 eth_price_usd = 2000  # Fallback value
             
             # Calculate USD values
-            eth_amount_usd = buy_event['eth_amount'] * eth_price_usd
+            eth_amount_usd = eth_amount * eth_price_usd
             
-            # Analyze buyer wallet
-            wallet_info = self.wallet_analyzer.get_wallet_info(buy_event['buyer'])
             if not wallet_info:
-                logger.error(f"Could not analyze wallet {buy_event['buyer']}")
+                logger.error("Could not analyze wallet %s", buyer)
                 wallet_info = {
                     'is_fresh_wallet': False,
                     'wallet_age_days': 999,
@@ -114,93 +251,222 @@ class TelegramBot:
             wallet_status = "Fresh" if wallet_info['is_fresh_wallet'] else f"Old ({wallet_info['wallet_age_days']} days)"
             
             # Create other holdings text
-            other_holdings_text = ""
-            for holding in wallet_info['token_holdings'][:3]:  # Show top 3 holdings
-                other_holdings_text += f"- ${holding['symbol']}: {holding['balance']:.4f} (~${holding['usd_value']:.2f})\n"
-            
-            if not other_holdings_text:
-                other_holdings_text = "- No significant holdings\n"
-            
-            # Create behavior text
-            behavior_text = "Swing Trader" if wallet_info['is_swing_trader'] else "Diamond Hands"
-            behavior_detail = f"({wallet_info['trading_info']})"
-            
-            # Get token trading info if the wallet has traded this token before
-            token_trading_info = self.wallet_analyzer.get_token_trading_info(buy_event['buyer'], buy_event['token_address'])
-            
-            # Create message text
-            message = f"{buy_event['token_name']} {buy_event['token_symbol']} 🔔 Buy!\n\n"
-            message += "🤑🤑🤑🤑🤑🤑🤑🤑🤑🤑\n\n"
-            message += f"💰| {buy_event['eth_amount']:,.4f} ETH (${eth_amount_usd:,.2f})\n"
-            # Di dalam metode send_buy_alert, ubah
-            message += f"📈| Got: {format_number(buy_event['token_amount'])} {buy_event['token_symbol']}\n"
-            
-            # Menjadi
-            message += f"📈| Got: {self.format_number(buy_event['token_amount'])} {buy_event['token_symbol']}\n"
-            
-            # Dan ubah semua panggilan format_number lainnya dengan cara yang sama
-            message += f"👤| Buyer: [Wallet]({ETHERSCAN_ADDRESS_URL}{buy_event['buyer']}) | [Tx]({ETHERSCAN_TX_URL}{buy_event['tx_hash']})\n"
+            other_holdings_text = "".join(
+                f"- ${holding['symbol']}: {holding['balance']:.4f} (~${holding['usd_value']:.2f})\n"
+                for holding in wallet_info['token_holdings'][:3]  # Show top 3 holdings
+            ) or "- No significant holdings\n"
             
             # Add token trading info if available
             if token_trading_info and token_trading_info['trade_count'] > 0:
-                message += f"📊| Position: Swing Trade ({token_trading_info['trade_count']} trades)\n"
-                message += f"🛒| Bought: {format_number(token_trading_info['bought_amount'])} tokens (${token_trading_info['bought_value_usd']:,.2f})\n"
-                message += f"💹| PNL: ${token_trading_info['total_pnl']:,.2f} ({token_trading_info['pnl_percentage']:,.2f}%)\n"
-                message += f"💼| Remaining: {format_number(token_trading_info['remaining_tokens'])} tokens (${token_trading_info['current_value_usd']:,.2f})\n"
+                position = ALERT_POSITION_TEMPLATE.format(
+                    trade_count=token_trading_info['trade_count'],
+                    bought_amount=self.format_number(token_trading_info['bought_amount']),
+                    bought_value_usd=token_trading_info['bought_value_usd'],
+                    total_pnl=token_trading_info['total_pnl'],
+                    pnl_percentage=token_trading_info['pnl_percentage'],
+                    remaining_tokens=self.format_number(token_trading_info['remaining_tokens']),
+                    current_value_usd=token_trading_info['current_value_usd']
+                )
             else:
-                message += f"🆕| Position: New\n"
+                position = ALERT_NEW_POSITION
             
-            # Pastikan untuk mendapatkan jumlah holder terbaru
-            message += f"👥| Holders: {token_info.get('holders', 'Unknown')}\n"
-            message += f"💲| Market Cap: ${token_info.get('market_cap', 0):,.2f}\n\n"
-            
-            message += f"🧠 Wallet Status: {wallet_status}\n"
-            message += f"🐋 Other Holdings:\n{other_holdings_text}"
-            message += f"📉 Behavior: {behavior_text}\n{behavior_detail}\n\n"
+            # Create message text
+            message = ALERT_TEMPLATE.format(
+                token_name=buy_event['token_name'],
+                token_symbol=buy_event['token_symbol'],
+                eth_amount=eth_amount,
+                eth_amount_usd=eth_amount_usd,
+                token_amount=self.format_number(buy_event['token_amount']),
+                address_url=ETHERSCAN_ADDRESS_URL,
+                buyer=buyer,
+                tx_url=ETHERSCAN_TX_URL,
+                tx_hash=tx_hash,
+                position=position,
+                holders=token_info.get('holders') or 'Unknown',
+                market_cap=token_info.get('market_cap') or 0,
+                wallet_status=wallet_status,
+                other_holdings=other_holdings_text,
+                behavior="Swing Trader" if wallet_info['is_swing_trader'] else "Diamond Hands",
+                trading_info=wallet_info['trading_info']
+            )
             
             # Create inline keyboard
-            keyboard = [
-                [
-                    InlineKeyboardButton("🛒 Buy", url=f"https://app.uniswap.org/#/swap?outputCurrency={buy_event['token_address']}"),
-                    InlineKeyboardButton("📊 DexScreener", url=token_info.get('dexscreener_url', f"https://dexscreener.com/ethereum/{buy_event['token_address']}"))
-                ],
-                [
-                    InlineKeyboardButton("📈 Trending", url=f"https://www.dextools.io/app/en/ether/pair-explorer/{buy_event['token_address']}")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = self._keyboard_for(token_address, token_info.get('dexscreener_url'))
             
             # Send message to all registered groups
-            registered_groups = self.db.get_registered_groups()
-            print(f"Sending notification to {len(registered_groups)} registered groups")
-            for chat_id in registered_groups:
-                try:
-                    print(f"Sending notification to group {chat_id}")
-                    # Use bot.send_message instead of await
-                    self.updater.bot.send_message(
-                        chat_id=chat_id,
-                        text=message,
-                        parse_mode='Markdown',
-                        disable_web_page_preview=True,
-                        reply_markup=reply_markup
-                    )
-                except Exception as e:
-                    logger.error(f"Error sending message to group {chat_id}: {e}")
+            logger.debug("Sending notification to %d registered groups", len(registered_groups))
+            await self._broadcast(registered_groups, {
+                'text': message,
+                'parse_mode': 'Markdown',
+                'disable_web_page_preview': True,
+                'reply_markup': reply_markup
+            })
         except Exception as e:
-            logger.error(f"Error sending buy alert: {e}")
+            logger.error("Error sending buy alert: %s", e)
+    
+    def _claim_transaction(self, tx_hash):
+        """
+        Check and record a transaction in one step, returning False if it was already processed.
+        Nothing awaits in between, so concurrent alerts for the same hash cannot both claim it.
+        """
+        if tx_hash in self._seen_tx or self.db.is_transaction_processed(tx_hash):
+            return False
+        self._mark_processed(tx_hash)
+        return True
+    
+    def _mark_processed(self, tx_hash):
+        """
+        Remember a transaction right away and queue it for the next batched database write
+        """
+        self._seen_tx[tx_hash] = None
+        if len(self._seen_tx) > SEEN_TX_CACHE_SIZE:
+            self._seen_tx.popitem(last=False)
+        
+        self._pending_tx.append(tx_hash)
+        if len(self._pending_tx) >= TX_FLUSH_BATCH_SIZE:
+            self._flush_processed()
+        elif self._tx_flush_handle is None:
+            self._tx_flush_handle = asyncio.get_running_loop().call_later(TX_FLUSH_INTERVAL, self._flush_processed)
+    
+    def _take_pending_tx(self):
+        """
+        Cancel the flush timer and hand over the queued transaction hashes
+        """
+        if self._tx_flush_handle is not None:
+            self._tx_flush_handle.cancel()
+            self._tx_flush_handle = None
+        pending, self._pending_tx = self._pending_tx, []
+        return pending
+    
+    def _flush_processed(self):
+        """
+        Write the queued transaction hashes in one transaction on the executor
+        """
+        pending = self._take_pending_tx()
+        if pending:
+            write = asyncio.get_running_loop().run_in_executor(None, self.db.mark_transactions_processed, pending)
+            self._tx_writes.add(write)
+            write.add_done_callback(self._tx_writes.discard)
+    
+    def _keyboard_for(self, token_address, dexscreener_url=None):
+        """
+        Get the serialized alert keyboard of a token, built once per token and DexScreener URL
+        """
+        dexscreener_url = dexscreener_url or f"{DEXSCREENER_TOKEN_URL}{token_address}"
+        cached = self._keyboard_cache.get(token_address)
+        if cached and cached[0] == dexscreener_url:
+            self._keyboard_cache.move_to_end(token_address)
+            return cached[1]
+        
+        keyboard = [
+            [
+                InlineKeyboardButton("🛒 Buy", url=f"{UNISWAP_SWAP_URL}{token_address}"),
+                InlineKeyboardButton("📊 DexScreener", url=dexscreener_url)
+            ],
+            [
+                InlineKeyboardButton("📈 Trending", url=f"{DEXTOOLS_PAIR_URL}{token_address}")
+            ]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard).to_dict()
+        self._keyboard_cache[token_address] = (dexscreener_url, reply_markup)
+        self._keyboard_cache.move_to_end(token_address)
+        if len(self._keyboard_cache) > KEYBOARD_CACHE_SIZE:
+            self._keyboard_cache.popitem(last=False)
+        return reply_markup
+    
+    async def _broadcast(self, chat_ids, payload):
+        """
+        Send the same message to many chats, concurrently within each batch
+        and pausing between batches to stay under Telegram's rate limit.
+        Returns the number of chats the message was delivered to.
+        """
+        delivered = 0
+        for i in range(0, len(chat_ids), BROADCAST_BATCH_SIZE):
+            if i:
+                await asyncio.sleep(BROADCAST_BATCH_DELAY)
+            batch = chat_ids[i:i + BROADCAST_BATCH_SIZE]
+            results = await asyncio.gather(
+                *(self._send_message({**payload, 'chat_id': chat_id}) for chat_id in batch),
+                return_exceptions=True
+            )
+            delivered += sum(result is True for result in results)
+        
+        if delivered < len(chat_ids):
+            logger.warning("Message delivered to %d of %d chats", delivered, len(chat_ids))
+        return delivered
+    
+    async def _send_message(self, payload):
+        """
+        Call sendMessage over the session shared with DexData, at most one message per second
+        per chat. Rate-limited messages wait the delay Telegram asks for, and network errors
+        back off exponentially with jitter, for up to SEND_MAX_ATTEMPTS attempts.
+        """
+        chat_id = payload['chat_id']
+        error = None
+        for attempt in range(SEND_MAX_ATTEMPTS):
+            delay = self._reserve_chat_slot(chat_id)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            try:
+                session = await self.dex_data.get_session()
+                if self._send_semaphore is None:
+                    self._send_semaphore = asyncio.Semaphore(BROADCAST_BATCH_SIZE)
+                async with self._send_semaphore:
+                    async with session.post(
+                        f"{TELEGRAM_API_URL}{self.token}/sendMessage", data=orjson.dumps(payload),
+                        headers=JSON_HEADERS, timeout=TELEGRAM_REQUEST_TIMEOUT
+                    ) as response:
+                        result = orjson.loads(await response.read())
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+                if attempt + 1 < SEND_MAX_ATTEMPTS:
+                    await asyncio.sleep(SEND_RETRY_BASE_DELAY * 2 ** attempt * (1 + random.random()))
+                continue
+            except Exception as e:
+                error = e
+                break
+            
+            if result.get('ok'):
+                return True
+            
+            error = result.get('description')
+            retry_after = (result.get('parameters') or {}).get('retry_after')
+            if not retry_after:
+                break
+            # Later sends to this chat, including the retry, wait out the limit too
+            self._chat_ready_at[chat_id] = max(self._chat_ready_at.get(chat_id, 0), time.monotonic() + retry_after)
+        
+        logger.error("Error sending message to chat %s: %s", chat_id, error)
+        return False
+    
+    def _reserve_chat_slot(self, chat_id):
+        """
+        Reserve the next send slot of a chat and return how many seconds to wait for it
+        """
+        now = time.monotonic()
+        ready_at = max(now, self._chat_ready_at.get(chat_id, 0))
+        self._chat_ready_at[chat_id] = ready_at + CHAT_SEND_INTERVAL
+        return ready_at - now
+    
+    async def close(self):
+        """
+        Close the HTTP session shared with DexData
+        """
+        await self.dex_data.close()
     
     # In the start_command method
-    def start_command(self, update: Update, context: CallbackContext):
+    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Handler for /start command
         """
-        update.message.reply_text(
+        await update.message.reply_text(
             'Hello! I am a bot that detects ERC-20 token purchases on Uniswap.\n'
             'Use /help to see the list of available commands.'
         )
     
     # In the help_command method
-    def help_command(self, update: Update, context: CallbackContext):
+    async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Handler for /help command
         """
@@ -214,10 +480,10 @@ class TelegramBot:
             '/removetoken <address> - Remove token from monitoring\n'
             '/listgroups - Display list of registered groups'
         )
-        update.message.reply_text(help_text)
+        await update.message.reply_text(help_text)
     
     # In the register_command method
-    def register_command(self, update: Update, context: CallbackContext):
+    async def register_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Handler for /register command
         """
@@ -227,19 +493,19 @@ class TelegramBot:
         
         # Check if this is a group chat
         if update.effective_chat.type not in ['group', 'supergroup']:
-            update.message.reply_text('This command can only be used in groups.')
+            await update.message.reply_text('This command can only be used in groups.')
             return
         
         # Register the group
         success = self.db.register_group(chat_id, chat_title, user_id)
         
         if success:
-            update.message.reply_text('This group has been successfully registered to receive token purchase notifications.')
+            await update.message.reply_text('This group has been successfully registered to receive token purchase notifications.')
         else:
-            update.message.reply_text('Failed to register group. Please try again later.')
+            await update.message.reply_text('Failed to register group. Please try again later.')
     
     # In the unregister_command method
-    def unregister_command(self, update: Update, context: CallbackContext):
+    async def unregister_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Handler for /unregister command
         """
@@ -249,23 +515,18 @@ class TelegramBot:
         success = self.db.unregister_group(chat_id)
         
         if success:
-            update.message.reply_text('This group has stopped receiving token purchase notifications.')
+            await update.message.reply_text('This group has stopped receiving token purchase notifications.')
         else:
-            update.message.reply_text('Failed to unregister group. Please try again later.')
+            await update.message.reply_text('Failed to unregister group. Please try again later.')
     
     # In the add_token_command method
-    def add_token_command(self, update: Update, context: CallbackContext):
+    async def add_token_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Handler for /addtoken command
         """
-        # Check if user is admin
-        if update.effective_user.id != ADMIN_USER_ID:
-            update.message.reply_text('You do not have permission to use this command.')
-            return
-        
         # Check arguments
         if len(context.args) < 3:
-            update.message.reply_text('Usage: /addtoken <address> <name> <symbol>')
+            await update.message.reply_text('Usage: /addtoken <address> <name> <symbol>')
             return
         
         token_address = context.args[0]
@@ -273,31 +534,26 @@ class TelegramBot:
         token_symbol = context.args[2]
         
         # Validate token address
-        if not self.w3.is_address(token_address):
-            update.message.reply_text('Invalid token address.')
+        if not is_address(token_address):
+            await update.message.reply_text('Invalid token address.')
             return
         
         # Add token to database
         success = self.db.add_token(token_address, token_name, token_symbol)
         
         if success:
-            update.message.reply_text(f'Token {token_name} ({token_symbol}) successfully added.')
+            await update.message.reply_text(f'Token {token_name} ({token_symbol}) successfully added.')
         else:
-            update.message.reply_text('Failed to add token. Please try again later.')
+            await update.message.reply_text('Failed to add token. Please try again later.')
     
     # In the remove_token_command method
-    def remove_token_command(self, update: Update, context: CallbackContext):
+    async def remove_token_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Handler for /removetoken command
         """
-        # Check if user is admin
-        if update.effective_user.id != ADMIN_USER_ID:
-            update.message.reply_text('You do not have permission to use this command.')
-            return
-        
         # Check arguments
         if len(context.args) < 1:
-            update.message.reply_text('Usage: /removetoken <address>')
+            await update.message.reply_text('Usage: /removetoken <address>')
             return
         
         token_address = context.args[0]
@@ -306,105 +562,152 @@ class TelegramBot:
         success = self.db.remove_token(token_address)
         
         if success:
-            update.message.reply_text(f'Token with address {token_address} successfully removed.')
+            await update.message.reply_text(f'Token with address {token_address} successfully removed.')
         else:
-            update.message.reply_text('Failed to remove token. Please try again later.')
+            await update.message.reply_text('Failed to remove token. Please try again later.')
     
     # In the list_tokens_command method
-    def list_tokens_command(self, update: Update, context: CallbackContext):
+    async def list_tokens_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Handler for /listtokens command
         """
         tokens = self.db.get_monitored_tokens()
         
         if not tokens:
-            update.message.reply_text('No tokens are currently being monitored.')
+            await update.message.reply_text('No tokens are currently being monitored.')
             return
         
         message = 'List of monitored tokens:\n\n'
         for token_address, token_name, token_symbol in tokens:
             message += f'• {token_name} ({token_symbol})\n  `{token_address}`\n\n'
         
-        update.message.reply_text(message, parse_mode='Markdown')
+        await self._reply_in_chunks(update, message, parse_mode='Markdown')
     
     # In the list_groups_command method
-    def list_groups_command(self, update: Update, context: CallbackContext):
+    async def list_groups_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Handler for /listgroups command
         """
-        # Check if user is admin
-        if update.effective_user.id != ADMIN_USER_ID:
-            update.message.reply_text('You do not have permission to use this command.')
-            return
-        
         groups = self.db.get_registered_groups()
         
         if not groups:
-            update.message.reply_text('No groups are currently registered.')
+            await update.message.reply_text('No groups are currently registered.')
             return
         
         message = 'List of registered groups:\n\n'
         for chat_id in groups:
             message += f'• Chat ID: {chat_id}\n'
         
-        update.message.reply_text(message)
+        await self._reply_in_chunks(update, message)
     
-    # Change from async def to def
-    def button_callback(self, update: Update, context: CallbackContext):
+    async def _reply_in_chunks(self, update, message, **kwargs):
         """
-        Handler for inline keyboard button presses
+        Reply with a message that may exceed Telegram's length limit, split on line boundaries
         """
-        query = update.callback_query
-        query.answer()
+        for chunk in split_message(message):
+            await update.message.reply_text(chunk, **kwargs)
     
-    # Change from async def to def
-    def error_handler(self, update: Update, context: CallbackContext):
+    async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Error handler for the bot
         """
-        logger.error(f"Update {update} caused error {context.error}")
+        logger.error("Update %s caused error %s", update, context.error)
     
-    def start(self):
+    async def start(self):
         """
         Start the bot
         """
-        self.updater.start_polling()
+        await self.application.initialize()
+        await self.application.start()
+        if TELEGRAM_WEBHOOK_URL:
+            await self._start_webhook()
+        else:
+            await self.application.updater.start_polling()
         logger.info("Bot started")
     
-    def stop(self):
+    async def _start_webhook(self):
+        """
+        Serve the webhook endpoint and point Telegram at it, so updates are pushed instead of polled
+        """
+        # Without a secret anyone who finds the URL could post forged updates, so make one up
+        self._webhook_secret = TELEGRAM_WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        
+        web_app = web.Application()
+        web_app.router.add_post(urlparse(TELEGRAM_WEBHOOK_URL).path or '/', self._handle_webhook)
+        self._webhook_runner = web.AppRunner(web_app)
+        await self._webhook_runner.setup()
+        await web.TCPSite(self._webhook_runner, TELEGRAM_WEBHOOK_LISTEN, TELEGRAM_WEBHOOK_PORT).start()
+        await self.application.bot.set_webhook(url=TELEGRAM_WEBHOOK_URL, secret_token=self._webhook_secret)
+    
+    async def _handle_webhook(self, request):
+        """
+        Queue an update pushed by Telegram for the application's handlers
+        """
+        secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not hmac.compare_digest(secret.encode(), self._webhook_secret.encode()):
+            return web.Response(status=403)
+        
+        try:
+            update = Update.de_json(orjson.loads(await request.read()), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning("Rejected malformed webhook update: %s", e)
+            return web.Response(status=400)
+        if update is None:
+            return web.Response(status=400)
+        await self.application.update_queue.put(update)
+        return web.Response()
+    
+    async def stop(self):
         """
         Stop the bot
         """
-        self.updater.stop()
+        if self._webhook_runner is not None:
+            await self._webhook_runner.cleanup()
+        if self.application.updater.running:
+            await self.application.updater.stop()
+        await self.application.stop()
+        await self.application.shutdown()
         logger.info("Bot stopped")
+        await self.close()
+        # Let in-flight writes finish, then write whatever is still queued before the database closes
+        if self._tx_writes:
+            await asyncio.gather(*self._tx_writes, return_exceptions=True)
+        pending = self._take_pending_tx()
+        if pending:
+            self.db.mark_transactions_processed(pending)
+        self._wallet_pool.shutdown(wait=False, cancel_futures=True)
+        self.wallet_analyzer.close()
         self.db.close()
     
-    def token_info_command(self, update: Update, context: CallbackContext):
+    async def token_info_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Handler for /tokeninfo command
         """
         # Check arguments
         if len(context.args) < 2:
-            update.message.reply_text('Usage: /tokeninfo <wallet_address> <token_address>')
+            await update.message.reply_text('Usage: /tokeninfo <wallet_address> <token_address>')
             return
         
         wallet_address = context.args[0]
         token_address = context.args[1]
         
         # Validate addresses
-        if not self.w3.is_address(wallet_address) or not self.w3.is_address(token_address):
-            update.message.reply_text('Invalid wallet or token address.')
+        if not is_address(wallet_address) or not is_address(token_address):
+            await update.message.reply_text('Invalid wallet or token address.')
             return
         
         # Get token trading info
-        trading_info = self.wallet_analyzer.get_token_trading_info(wallet_address, token_address)
+        # WalletAnalyzer uses blocking HTTP, so keep it off the event loop
+        trading_info = await asyncio.get_running_loop().run_in_executor(
+            self._wallet_pool, self.wallet_analyzer.get_token_trading_info, wallet_address, token_address
+        )
         
         if not trading_info:
-            update.message.reply_text('Could not retrieve trading information for this token.')
+            await update.message.reply_text('Could not retrieve trading information for this token.')
             return
         
         if trading_info['trade_count'] == 0:
-            update.message.reply_text('No trading activity found for this token in this wallet.')
+            await update.message.reply_text('No trading activity found for this token in this wallet.')
             return
         
         # Create message
@@ -420,10 +723,10 @@ class TelegramBot:
         message += f"Unrealized PNL: ${trading_info['unrealized_pnl']:.2f}\n"
         message += f"Total PNL: ${trading_info['total_pnl']:.2f} ({trading_info['pnl_percentage']:.2f}%)\n"
         
-        update.message.reply_text(message)
+        await update.message.reply_text(message)
     
     # Di dalam metode _register_handlers, tambahkan:
-    def patterns_command(self, update: Update, context: CallbackContext):
+    async def patterns_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Handler for /patterns command
         """
@@ -441,18 +744,21 @@ class TelegramBot:
         patterns = self.db.get_recent_patterns(token_address, hours=hours)
         
         if not patterns:
-            update.message.reply_text('No trading patterns detected in the specified time period.')
+            await update.message.reply_text('No trading patterns detected in the specified time period.')
             return
         
         message = f"Trading patterns detected in the last {hours} hours:\n\n"
         
+        # Look up all tokens at once; token_address is at index 1
+        tokens_info = await self.dex_data.get_tokens_info([pattern[1] for pattern in patterns])
+        
         for pattern in patterns:
-            token_info = self.dex_data.get_token_info(pattern[1])  # token_address is at index 1
+            token_info = tokens_info.get(pattern[1].lower())
             token_symbol = token_info['symbol'] if token_info else "Unknown"
             
             pattern_type = pattern[2]  # pattern_type is at index 2
-            start_time = datetime.fromtimestamp(pattern[3]).strftime('%Y-%m-%d %H:%M')  # start_timestamp at index 3
-            end_time = datetime.fromtimestamp(pattern[4]).strftime('%Y-%m-%d %H:%M')  # end_timestamp at index 4
+            start_time = format_timestamp(pattern[3])  # start_timestamp at index 3
+            end_time = format_timestamp(pattern[4])  # end_timestamp at index 4
             percent_change = pattern[7]  # percent_change at index 7
             
             message += f"Token: {token_symbol} ({pattern[1][:6]}...{pattern[1][-4:]})\n"
@@ -460,9 +766,9 @@ class TelegramBot:
             message += f"Time: {start_time} to {end_time}\n"
             message += f"Price Change: {percent_change:.2f}%\n\n"
         
-        update.message.reply_text(message)
+        await self._reply_in_chunks(update, message)
     
-    # Ubah dari
+    @staticmethod
     def format_number(num):
         """Format angka besar menjadi format yang mudah dibaca (K, M, B, T)"""
         if num is None:
@@ -1,34 +1,206 @@
 # Module for analyzing Ethereum wallets
 
 import requests
-import json
-from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+import heapq
+from operator import itemgetter
 import time
-from config import ETHPLORER_API_KEY, ETHPLORER_API_URL, FRESH_WALLET_THRESHOLD, SWING_TRADER_THRESHOLD
+import random
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import (ETHPLORER_API_KEY, ETHPLORER_API_URL, ETHPLORER_RPS, FRESH_WALLET_THRESHOLD, HTTP_REQUEST_TIMEOUT,
+                    SWING_TRADER_THRESHOLD)
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Wallet ages and trading windows are computed with plain epoch arithmetic
+SECONDS_PER_DAY = 86400
+
+# Seconds a wallet analysis is reused before Ethplorer is queried again
+WALLET_INFO_TTL = 600
+
+# Maximum number of wallet analyses kept in memory
+WALLET_INFO_CACHE_SIZE = 4096
+
+# Maximum number of validated Ethplorer responses kept for conditional requests
+CONDITIONAL_CACHE_SIZE = 256
+
+# Threads used to overlap the independent Ethplorer requests of one analysis
+ETHPLORER_REQUEST_WORKERS = 8
+
+# Divisors for the token decimals seen in practice, as floats so dividing by them skips int conversion
+DECIMAL_SCALES = tuple(float(10 ** decimals) for decimals in range(37))
+
+def decimal_scale(decimals):
+    """Get 10 ** decimals, from the lookup table for common token decimals"""
+    return DECIMAL_SCALES[decimals] if 0 <= decimals < len(DECIMAL_SCALES) else 10 ** decimals
+
+class JitteredRetry(Retry):
+    """
+    Retry whose exponential backoff is stretched by a random factor, so requests
+    throttled together do not retry together. Retry-After is still honored as is.
+    Each re-sent attempt also takes a token from the rate limiter, if one is given.
+    """
+    def __init__(self, *args, rate_limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter
+    
+    def new(self, **kwargs):
+        # urllib3 copies the retry state after every attempt, which would drop the limiter
+        retry = super().new(**kwargs)
+        retry.rate_limiter = self.rate_limiter
+        return retry
+    
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return backoff * (1 + random.random())
+    
+    def sleep(self, response=None):
+        super().sleep(response)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread issuing requests. Callers reserve a token
+    and sleep until it is due, so requests are spaced out instead of rejected.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
 
 class WalletAnalyzer:
-    def __init__(self):
+    def __init__(self, db=None):
         self.api_key = ETHPLORER_API_KEY
         self.api_url = ETHPLORER_API_URL
+        # First transaction times are stored in the database since a wallet's age only grows
+        self.db = db or Database()
+        self._wallet_info_cache = OrderedDict()
+        self._conditional_cache = OrderedDict()
+        self._cache_lock = threading.Lock()  # Called from executor threads
+        # Every Ethplorer request of every analysis shares the key's rate limit, retries included
+        self._rate_limiter = RateLimiter(ETHPLORER_RPS) if ETHPLORER_RPS > 0 else None
+        self.session = self._create_session()
+        self._pool = ThreadPoolExecutor(max_workers=ETHPLORER_REQUEST_WORKERS, thread_name_prefix='ethplorer')
+    
+    def _create_session(self):
+        """
+        Create a requests session that keeps Ethplorer connections alive and retries transient errors
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=64,
+            max_retries=JitteredRetry(
+                total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                rate_limiter=self._rate_limiter
+            )
+        )
+        session.mount('https://', adapter)
+        return session
+    
+    def _get_json(self, url):
+        """
+        GET an Ethplorer endpoint over the pooled session and decode the JSON body.
+        Responses that carry an ETag or Last-Modified are revalidated on the next
+        request for the same URL, and a 304 reuses the body decoded last time.
+        """
+        with self._cache_lock:
+            cached = self._conditional_cache.get(url)
+        
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
+        response = self.session.get(url, headers=cached[0] if cached else None, timeout=HTTP_REQUEST_TIMEOUT)
+        if response.status_code == 304 and cached:
+            return cached[1]
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        # Errors reported in the body must not be mistaken for an empty result
+        if isinstance(data, dict) and 'error' in data:
+            raise ValueError(f"Ethplorer error: {data['error']}")
+        
+        validators = {}
+        if 'ETag' in response.headers:
+            validators['If-None-Match'] = response.headers['ETag']
+        if 'Last-Modified' in response.headers:
+            validators['If-Modified-Since'] = response.headers['Last-Modified']
+        if validators:
+            with self._cache_lock:
+                self._conditional_cache[url] = (validators, data)
+                self._conditional_cache.move_to_end(url)
+                if len(self._conditional_cache) > CONDITIONAL_CACHE_SIZE:
+                    self._conditional_cache.popitem(last=False)
+        return data
+    
+    def close(self):
+        """
+        Stop the request pool and close the HTTP session
+        """
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
     
     def get_wallet_info(self, wallet_address):
         """
         Get wallet information including age, token holdings, and transaction history
         """
+        key = wallet_address.lower()
+        with self._cache_lock:
+            entry = self._wallet_info_cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        
+        wallet_info = self._fetch_wallet_info(wallet_address)
+        if wallet_info is not None:
+            with self._cache_lock:
+                self._wallet_info_cache[key] = (time.monotonic() + WALLET_INFO_TTL, wallet_info)
+                self._wallet_info_cache.move_to_end(key)
+                if len(self._wallet_info_cache) > WALLET_INFO_CACHE_SIZE:
+                    self._wallet_info_cache.popitem(last=False)
+        return wallet_info
+    
+    def _fetch_wallet_info(self, wallet_address):
         try:
+            # The trading history and first transaction do not depend on the address info,
+            # so they are fetched alongside it
+            history_url = f"{self.api_url}/getAddressHistory/{wallet_address}?apiKey={self.api_key}&type=transfer&limit=50"
+            pending_history = self._pool.submit(self._get_json, history_url)
+            
+            # A wallet seen before already has its first transaction time stored
+            first_tx_timestamp = self.db.get_wallet_first_tx(wallet_address)
+            pending_first_tx = None
+            if first_tx_timestamp is None:
+                first_tx_url = f"{self.api_url}/getAddressTransactions/{wallet_address}?apiKey={self.api_key}&limit=1&sort=asc"
+                pending_first_tx = self._pool.submit(self._get_json, first_tx_url)
+            
             # Get wallet info
             url = f"{self.api_url}/getAddressInfo/{wallet_address}?apiKey={self.api_key}"
-            response = requests.get(url)
-            data = response.json()
+            data = self._get_json(url)
             
             # Get wallet age
-            wallet_age = self._calculate_wallet_age(data)
+            wallet_age = self._calculate_wallet_age(wallet_address, data, first_tx_timestamp, pending_first_tx)
             
             # Get token holdings
             token_holdings = self._get_token_holdings(data)
             
             # Determine if wallet is a swing trader
-            is_swing_trader, trading_info = self._analyze_trading_behavior(wallet_address)
+            is_swing_trader, trading_info = self._analyze_trading_behavior(wallet_address, pending_history)
             
             return {
                 'address': wallet_address,
@@ -38,33 +210,36 @@ class WalletAnalyzer:
                 'is_swing_trader': is_swing_trader,
                 'trading_info': trading_info
             }
-        except Exception as e:
-            print(f"Error analyzing wallet: {e}")
+        except Exception:
+            logger.exception("Error analyzing wallet %s", wallet_address)
             return None
     
-    def _calculate_wallet_age(self, wallet_data):
+    def _calculate_wallet_age(self, wallet_address, wallet_data, first_tx_timestamp, pending_first_tx):
         """
-        Calculate wallet age in days
+        Calculate wallet age in days from the stored first transaction time,
+        or from the first transaction requested by _fetch_wallet_info
         """
         try:
+            if first_tx_timestamp is not None:
+                return (int(time.time()) - first_tx_timestamp) // SECONDS_PER_DAY
+            
             # Try to get the first transaction timestamp
             if 'ETH' in wallet_data and 'transfersCount' in wallet_data['ETH'] and wallet_data['ETH']['transfersCount'] > 0:
                 # Get first transaction
-                address = wallet_data.get('address')
-                url = f"{self.api_url}/getAddressTransactions/{address}?apiKey={self.api_key}&limit=1&sort=asc"
-                response = requests.get(url)
-                transactions = response.json()
+                transactions = pending_first_tx.result()
                 
                 if transactions and len(transactions) > 0:
                     first_tx_timestamp = transactions[0].get('timestamp', 0)
-                    wallet_creation_date = datetime.fromtimestamp(first_tx_timestamp)
-                    age_days = (datetime.now() - wallet_creation_date).days
-                    return age_days
+                    if first_tx_timestamp:
+                        self.db.store_wallet_first_tx(wallet_address, first_tx_timestamp)
+                    return (int(time.time()) - first_tx_timestamp) // SECONDS_PER_DAY
+            else:
+                pending_first_tx.cancel()
             
             # If we can't determine the age, return a large number
             return 999
-        except Exception as e:
-            print(f"Error calculating wallet age: {e}")
+        except Exception:
+            logger.exception("Error calculating wallet age of %s", wallet_address)
             return 999
     
     def _get_token_holdings(self, wallet_data):
@@ -82,71 +257,73 @@ class WalletAnalyzer:
                     if not token_info.get('symbol') or not token_info.get('name'):
                         continue
                     
-                    # Calculate token balance
-                    decimals = int(token_info.get('decimals', 18))
-                    balance = float(token.get('balance', 0)) / (10 ** decimals)
+                    # Tokens without a USD price cannot pass the value filter, so skip them first.
+                    # Ethplorer sends price: false for unpriced tokens rather than omitting it.
+                    price = token_info.get('price')
+                    price_usd = float(price.get('rate') or 0) if price else 0
+                    if not price_usd:
+                        continue
                     
-                    # Get USD value if available
-                    price_usd = float(token_info.get('price', {}).get('rate', 0))
+                    # Calculate token balance; empty balances are worthless whatever the price
+                    raw_balance = float(token.get('balance', 0))
+                    if not raw_balance:
+                        continue
+                    decimals = int(token_info.get('decimals', 18))
+                    balance = raw_balance / decimal_scale(decimals)
                     usd_value = balance * price_usd
                     
                     # Only include tokens with significant value (> $10)
                     if usd_value > 10:
-                        holdings.append({
-                            'symbol': token_info.get('symbol'),
-                            'name': token_info.get('name'),
-                            'balance': balance,
-                            'usd_value': usd_value
-                        })
-            
-            # Sort by USD value (highest first)
-            holdings.sort(key=lambda x: x['usd_value'], reverse=True)
-            
-            # Limit to top 5 holdings
-            return holdings[:5]
-        except Exception as e:
-            print(f"Error getting token holdings: {e}")
+                        holdings.append((usd_value, balance, token_info))
+            
+            # Top 5 holdings by USD value (highest first), without sorting the rest;
+            # only those are turned into dicts
+            return [
+                {
+                    'symbol': token_info.get('symbol'),
+                    'name': token_info.get('name'),
+                    'balance': balance,
+                    'usd_value': usd_value
+                }
+                for usd_value, balance, token_info in heapq.nlargest(5, holdings, key=itemgetter(0))
+            ]
+        except Exception:
+            logger.exception("Error getting token holdings")
             return []
     
-    def _analyze_trading_behavior(self, wallet_address):
+    def _analyze_trading_behavior(self, wallet_address, pending_history):
         """
         Analyze if the wallet is a swing trader based on recent transactions
         """
         try:
-            # Get recent transactions (last 24 hours)
-            url = f"{self.api_url}/getAddressHistory/{wallet_address}?apiKey={self.api_key}&type=transfer&limit=50"
-            response = requests.get(url)
-            history = response.json()
+            # Wait for the recent transactions requested by _fetch_wallet_info
+            history = pending_history.result()
             
             if 'operations' not in history:
                 return False, "No recent transactions"
             
             # Filter transactions in the last 24 hours
-            now = datetime.now()
-            yesterday = now - timedelta(days=1)
-            yesterday_timestamp = int(yesterday.timestamp())
+            yesterday_timestamp = int(time.time()) - SECONDS_PER_DAY
             
             recent_sells = 0
-            tokens_sold = set()
+            wallet_lower = wallet_address.lower()
             
             for op in history['operations']:
-                # Skip old transactions
+                # Operations come newest first, so everything after the first old one is older too
                 if op.get('timestamp', 0) < yesterday_timestamp:
-                    continue
+                    break
                 
                 # Check if this is a token sale (transfer from this address)
-                if op.get('from') == wallet_address.lower():
+                if op.get('from') == wallet_lower:
                     recent_sells += 1
-                    if 'tokenInfo' in op and 'symbol' in op['tokenInfo']:
-                        tokens_sold.add(op['tokenInfo']['symbol'])
             
             # In the _analyze_trading_behavior method
             is_swing_trader = recent_sells >= SWING_TRADER_THRESHOLD
             trading_info = f"Sold {recent_sells} tokens in last 24h"
             
             return is_swing_trader, trading_info
-        except Exception as e:
-            print(f"Error analyzing trading behavior: {e}")
+        except Exception:
+            logger.exception("Error analyzing trading behavior of %s", wallet_address)
             return False, "Could not analyze trading behavior"
     
     def get_token_trading_info(self, wallet_address, token_address):
@@ -156,8 +333,7 @@ class WalletAnalyzer:
         try:
             # Get token transactions for this wallet
             url = f"{self.api_url}/getAddressHistory/{wallet_address}?apiKey={self.api_key}&token={token_address}&type=transfer&limit=100"
-            response = requests.get(url)
-            history = response.json()
+            history = self._get_json(url)
             
             if 'operations' not in history:
                 return {
@@ -171,41 +347,40 @@ class WalletAnalyzer:
                     'pnl_percentage': 0
                 }
             
-            # Process transactions
-            buys = []
-            sells = []
+            # Process transactions, accumulating the totals in the same pass
+            buy_count = 0
+            sell_count = 0
+            total_bought = 0
+            total_bought_value = 0
+            total_sold = 0
+            total_sold_value = 0
             token_decimals = 18  # Default
             token_symbol = "Unknown"
+            wallet_lower = wallet_address.lower()
             
             for op in history['operations']:
-                if 'tokenInfo' in op:
-                    token_decimals = int(op['tokenInfo'].get('decimals', 18))
-                    token_symbol = op['tokenInfo'].get('symbol', 'Unknown')
+                token_info = op.get('tokenInfo')
+                if token_info is not None:
+                    token_decimals = int(token_info.get('decimals', 18))
+                    token_symbol = token_info.get('symbol', 'Unknown')
                 
-                # Buy transaction (tokens coming in)
-                if op.get('to') == wallet_address.lower():
-                    amount = float(op.get('value', 0)) / (10 ** token_decimals)
-                    buys.append({
-                        'amount': amount,
-                        'timestamp': op.get('timestamp', 0),
-                        'price_usd': op.get('usdPrice', 0)
-                    })
+                # Buy transaction (tokens coming in) or sell transaction (tokens going out)
+                is_buy = op.get('to') == wallet_lower
+                if not is_buy and op.get('from') != wallet_lower:
+                    continue
                 
-                # Sell transaction (tokens going out)
-                elif op.get('from') == wallet_address.lower():
-                    amount = float(op.get('value', 0)) / (10 ** token_decimals)
-                    sells.append({
-                        'amount': amount,
-                        'timestamp': op.get('timestamp', 0),
-                        'price_usd': op.get('usdPrice', 0)
-                    })
-            
-            # Calculate totals
-            total_bought = sum(buy['amount'] for buy in buys)
-            total_bought_value = sum(buy['amount'] * buy['price_usd'] for buy in buys if buy['price_usd'])
-            
-            total_sold = sum(sell['amount'] for sell in sells)
-            total_sold_value = sum(sell['amount'] * sell['price_usd'] for sell in sells if sell['price_usd'])
+                # Each operation's fields are read once, whichever side it is on
+                amount = float(op.get('value', 0)) / decimal_scale(token_decimals)
+                price_usd = op.get('usdPrice', 0)
+                value_usd = amount * price_usd if price_usd else 0
+                if is_buy:
+                    buy_count += 1
+                    total_bought += amount
+                    total_bought_value += value_usd
+                else:
+                    sell_count += 1
+                    total_sold += amount
+                    total_sold_value += value_usd
             
             remaining_tokens = total_bought - total_sold
             
@@ -213,11 +388,10 @@ class WalletAnalyzer:
             current_price = 0
             try:
                 token_url = f"{self.api_url}/getTokenInfo/{token_address}?apiKey={self.api_key}"
-                token_response = requests.get(token_url)
-                token_data = token_response.json()
+                token_data = self._get_json(token_url)
                 current_price = float(token_data.get('price', {}).get('rate', 0))
-            except Exception as e:
-                print(f"Error getting current token price: {e}")
+            except Exception:
+                logger.exception("Error getting current price of token %s", token_address)
             
             # Calculate PNL
             current_value = remaining_tokens * current_price
@@ -230,9 +404,9 @@ class WalletAnalyzer:
             
             return {
                 'token_symbol': token_symbol,
-                'trade_count': len(buys) + len(sells),
-                'buy_count': len(buys),
-                'sell_count': len(sells),
+                'trade_count': buy_count + sell_count,
+                'buy_count': buy_count,
+                'sell_count': sell_count,
                 'bought_amount': total_bought,
                 'bought_value_usd': total_bought_value,
                 'sold_amount': total_sold,
@@ -245,6 +419,6 @@ class WalletAnalyzer:
                 'total_pnl': total_pnl,
                 'pnl_percentage': pnl_percentage
             }
-        except Exception as e:
-            print(f"Error getting token trading info: {e}")
+        except Exception:
+            logger.exception("Error getting trading info of %s for token %s", wallet_address, token_address)
             return None
\ No newline at end of file